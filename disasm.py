@@ -0,0 +1,357 @@
+"""
+Streaming disassembler and control-flow analysis for UM binaries
+
+The analysis finds jump targets by tracking constant values loaded in registers
+(mostly with 'orth', possibly combined with arithmetic or conditional moves)
+up to 'load' instructions from array 0, which are jumps. From those targets it
+splits the program into basic blocks, marks blocks that are reachable from the
+entry point as code, and builds a cross-reference index that can be queried by
+other tools and saved to disk next to the binary.
+"""
+
+from bisect import bisect_right
+import gzip
+import hashlib
+import json
+import struct
+
+
+CHUNK_SIZE = 1 << 16
+
+# Maximum number of possible constant values tracked per register
+MAX_VALUES = 4
+
+NUM_MASK = 0xFFFFFFFF
+
+# opcode -> (name, format, operands); format fields are registers a, b, c, s
+# and value v, operands are the raw fields shown in the value column
+OPS = {
+    0: ("cmov", "r{a} = r{b} if r{c}", "abc"),
+    1: ("aidx", "r{a} = array(r{b})[r{c}]", "abc"),
+    2: ("aamd", "array(r{a})[r{b}] = r{c}", "abc"),
+    3: ("add", "r{a} = r{b} + r{c}", "abc"),
+    4: ("mul", "r{a} = r{b} * r{c}", "abc"),
+    5: ("div", "r{a} = r{b} / r{c}", "abc"),
+    6: ("nand", "r{a} = r{b} ~& r{c}", "abc"),
+    7: ("halt", "halt", ""),
+    8: ("aloc", "r{b} = alloc(r{c})", "bc"),
+    9: ("aban", "del array(r{c})", "c"),
+    10: ("out", "out r{c}", "c"),
+    11: ("in", "in r{c}", "c"),
+    12: ("load", "load array(r{b}).r{c}", "bc"),
+    13: ("orth", "r{s} = {v}", "sv"),
+}
+
+HALT = 7
+LOAD = 12
+
+ARITH = {
+    3: lambda x, y: (x + y) & NUM_MASK,
+    4: lambda x, y: (x * y) & NUM_MASK,
+    5: lambda x, y: x // y if y else None,
+    6: lambda x, y: (x & y) ^ NUM_MASK,
+}
+
+KIND_CODE = "code"
+KIND_DATA = "data"
+KIND_UNKNOWN = "unknown"
+
+
+def iter_words(filename):
+    """
+    Stream 32-bit big-endian words from <filename> without loading it whole, ignoring
+    trailing bytes that do not make a full word
+    """
+    with open(filename, mode="rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            for (w,) in struct.iter_unpack(">L", chunk[: len(chunk) // 4 * 4]):
+                yield w
+
+
+def file_digest(filename):
+    h = hashlib.sha1()
+    with open(filename, mode="rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def words_digest(words):
+    h = hashlib.sha1()
+    for i in range(0, len(words), CHUNK_SIZE):
+        chunk = words[i : i + CHUNK_SIZE]
+        h.update(struct.pack(f">{len(chunk)}L", *chunk))
+    return h.hexdigest()
+
+
+def scan(words, leaders=frozenset()):
+    """
+    Track constant registers through <words> and return the jumps found, as a
+    dict of source address -> tuple of targets, or None when the target could
+    not be determined. Register values are forgotten after control transfers
+    and at every address in <leaders>, where other paths may join.
+    """
+    jumps = {}
+    unknown = [None] * 8
+    regs = list(unknown)
+
+    for i, w in enumerate(words):
+        if i in leaders:
+            regs = list(unknown)
+
+        op = w >> 28
+        a, b, c = (w >> 6) & 7, (w >> 3) & 7, w & 7
+
+        if op == 13:
+            regs[(w >> 25) & 7] = (w & 0x1FFFFFF,)
+        elif op == 0:
+            cond = regs[c]
+            if cond is not None and 0 not in cond:
+                regs[a] = regs[b]
+            elif cond == (0,):
+                pass
+            elif regs[a] is not None and regs[b] is not None:
+                values = tuple(sorted(set(regs[a] + regs[b])))
+                regs[a] = values if len(values) <= MAX_VALUES else None
+            else:
+                regs[a] = None
+        elif op in ARITH:
+            x, y = regs[b], regs[c]
+            if x is not None and y is not None and len(x) * len(y) <= MAX_VALUES:
+                values = {ARITH[op](vx, vy) for vx in x for vy in y}
+                regs[a] = None if None in values else tuple(sorted(values))
+            else:
+                regs[a] = None
+        elif op == 1:
+            regs[a] = None
+        elif op == 8:
+            regs[b] = None
+        elif op == 11:
+            regs[c] = None
+        elif op == LOAD:
+            if regs[b] == (0,):
+                jumps[i] = regs[c]
+            regs = list(unknown)
+        elif op == HALT or op not in OPS:
+            regs = list(unknown)
+
+    return jumps
+
+
+class XrefIndex:
+    """
+    Basic blocks and cross-references of a UM program.
+
+    Blocks are stored as sorted lists of start and end addresses, along with
+    their kind (code, data or unknown). Jumps map the address of a 'load' from
+    array 0 to the tuple of its possible targets, or to None for computed jumps
+    that could not be resolved; refs is the reverse mapping, from targets to
+    the sorted list of their sources.
+    """
+
+    VERSION = 1
+
+    def __init__(self, digest, size, starts, kinds, jumps):
+        self.digest = digest
+        self.size = size
+        self.starts = starts
+        self.kinds = kinds
+        self.jumps = jumps
+
+        self.refs = {}
+        for src, targets in sorted(jumps.items()):
+            for t in targets or ():
+                self.refs.setdefault(t, []).append(src)
+
+    @staticmethod
+    def build(words, digest):
+        """
+        Analyze a program; <words> is a callable returning a fresh iterable of
+        program words for each pass, so that it can be streamed from a file.
+        """
+        # A first pass finds jump targets without knowing where blocks start,
+        # the second one forgets register values at each of those targets.
+        jumps = scan(words())
+        jumps = scan(words(), frozenset(t for ts in jumps.values() for t in ts or ()))
+
+        # Blocks end after instructions that never fall through
+        stops = set()
+        invalid = set()
+        size = 0
+        for i, w in enumerate(words()):
+            op = w >> 28
+            if op not in OPS:
+                invalid.add(i)
+                stops.add(i)
+            elif op in (HALT, LOAD):
+                stops.add(i)
+            size += 1
+
+        targets = {t for ts in jumps.values() for t in ts or ()}
+        starts = sorted(
+            s for s in {0} | targets | {i + 1 for i in stops} if s < size
+        )
+        ends = starts[1:] + [size]
+
+        # Blocks reachable from the entry point are code
+        reachable = set()
+        frontier = [0] if size else []
+        while frontier:
+            b = frontier.pop()
+            if b in reachable:
+                continue
+            reachable.add(b)
+
+            last = ends[b] - 1
+            if last not in stops and ends[b] < size:
+                frontier.append(b + 1)
+            for t in jumps.get(last) or ():
+                if t < size:
+                    frontier.append(bisect_right(starts, t) - 1)
+
+        kinds = [
+            (
+                KIND_CODE
+                if b in reachable
+                else KIND_DATA if starts[b] in invalid else KIND_UNKNOWN
+            )
+            for b in range(len(starts))
+        ]
+
+        return XrefIndex(digest, size, starts, kinds, jumps)
+
+    @staticmethod
+    def for_file(filename, cache=None):
+        """
+        Return the index for binary <filename>, loading it from <cache>
+        (defaults to '<filename>.xref') when it is up to date, or building
+        and saving it otherwise.
+        """
+        cache = cache or f"{filename}.xref"
+        digest = file_digest(filename)
+
+        try:
+            index = XrefIndex.load(cache)
+            if index.digest == digest:
+                return index
+        except (OSError, ValueError, KeyError):
+            pass
+
+        index = XrefIndex.build(lambda: iter_words(filename), digest)
+        index.save(cache)
+        return index
+
+    @staticmethod
+    def for_words(words):
+        return XrefIndex.build(lambda: words, words_digest(words))
+
+    def save(self, filename):
+        with gzip.open(filename, mode="wt") as f:
+            json.dump(
+                {
+                    "version": self.VERSION,
+                    "digest": self.digest,
+                    "size": self.size,
+                    "starts": self.starts,
+                    "kinds": self.kinds,
+                    "jumps": [[k, v] for k, v in sorted(self.jumps.items())],
+                },
+                f,
+            )
+
+    @staticmethod
+    def load(filename):
+        with gzip.open(filename, mode="rt") as f:
+            data = json.load(f)
+
+        if data["version"] != XrefIndex.VERSION:
+            raise ValueError(f"Unsupported index version {data['version']}")
+
+        return XrefIndex(
+            data["digest"],
+            data["size"],
+            data["starts"],
+            data["kinds"],
+            {k: tuple(v) if v is not None else None for k, v in data["jumps"]},
+        )
+
+    def block_index(self, addr):
+        return bisect_right(self.starts, addr) - 1
+
+    def block_at(self, addr):
+        """
+        Return (start, end, kind) of the block containing <addr>
+        """
+        b = self.block_index(addr)
+        end = self.starts[b + 1] if b + 1 < len(self.starts) else self.size
+        return self.starts[b], end, self.kinds[b]
+
+    def blocks(self):
+        for b, start in enumerate(self.starts):
+            end = self.starts[b + 1] if b + 1 < len(self.starts) else self.size
+            yield start, end, self.kinds[b]
+
+    def is_code(self, addr):
+        return self.kinds[self.block_index(addr)] == KIND_CODE
+
+    def xrefs_to(self, addr):
+        """
+        Addresses of jumps that may land on <addr>
+        """
+        return self.refs.get(addr, [])
+
+    def xrefs_from(self, addr):
+        """
+        Possible targets of the jump at <addr>: empty if <addr> is not a jump,
+        None if it is a computed jump that could not be resolved.
+        """
+        return self.jumps.get(addr, ())
+
+    @property
+    def computed_jumps(self):
+        return sorted(k for k, v in self.jumps.items() if v is None)
+
+
+def disassemble(words, index, out):
+    """
+    Write the disassembly of <words> (any iterable, consumed once) to <out>,
+    annotated with blocks and cross-references from <index>.
+    """
+    starts = set(index.starts)
+
+    for i, w in enumerate(words):
+        if i in starts:
+            start, end, kind = index.block_at(i)
+            out.write(f"\n; block {start:08x}-{end - 1:08x} ({kind})\n")
+
+        finger = f"{i:08x}"
+        data = f"{w >> 24:02x} {(w >> 16) & 0xFF:02x} {(w >> 8) & 0xFF:02x} {w & 0xFF:02x}"
+        op = w >> 28
+
+        try:
+            name, fmt, operands = OPS[op]
+        except KeyError:
+            value = str(w)
+            text = ".dat"
+        else:
+            f = {
+                "a": (w >> 6) & 7,
+                "b": (w >> 3) & 7,
+                "c": w & 7,
+                "s": (w >> 25) & 7,
+                "v": w & 0x1FFFFFF,
+            }
+            value = " ".join([str(op), *(str(f[o]) for o in operands)])
+            text = f"{name.upper():<4s} " + fmt.format(**f)
+
+        notes = []
+        if i in index.refs:
+            notes.append("<- " + ", ".join(f"{s:08x}" for s in index.refs[i]))
+        if i in index.jumps:
+            targets = index.jumps[i]
+            notes.append(
+                "-> " + ", ".join(f"{t:08x}" for t in targets) if targets else "-> ?"
+            )
+        note = f"; {' '.join(notes)}" if notes else ""
+
+        out.write(f"{finger}: {data} | {value:13s} | {text:30s} {note}".rstrip() + "\n")
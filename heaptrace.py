@@ -0,0 +1,207 @@
+"""
+Heap allocation tracing for the UM allocator (alloc / abandon operations)
+"""
+
+import heapq
+import json
+import random
+import time
+
+
+def size_class_label(cls):
+    """
+    Size classes are bit lengths: 0 for empty arrays, n for sizes in [2^(n-1), 2^n)
+    """
+    if cls == 0:
+        return "0"
+    if cls == 1:
+        return "1"
+    return f"{1 << (cls - 1)}-{(1 << cls) - 1}"
+
+
+class HeapTrace:
+    """
+    Collects allocation statistics while attached to a machine.
+
+    Counters (size classes, allocation sites, live bytes) are updated for every
+    allocation, but only one array in <sample> on average is followed until it is
+    abandoned to measure lifetimes, which keeps the per-allocation overhead low.
+    Sampling intervals are randomized so that they do not resonate with regular
+    allocation patterns in the program. A point of the live heap timeline is
+    recorded every <every> allocations.
+
+    Time is measured both in seconds and in allocations, the latter being
+    independent from the speed of the machine.
+    """
+
+    def __init__(self, arrays, sample=16, every=1024, top=20):
+        self.sample = sample
+        self.every = every
+        self.top = top
+
+        self.started = time.perf_counter()
+        self.allocs = 0
+        self.frees = 0
+        self.live_arrays = len(arrays)
+        self.live_words = sum(len(a) for a in arrays.values())
+        self.peak_words = self.live_words
+
+        # size class -> [allocations, words allocated]
+        self.classes = {}
+        # allocation finger -> [allocations, words allocated, frees]
+        self.sites = {}
+        # sampled array identifier -> (alloc clock, time, finger, size)
+        self.births = {}
+        self.countdown = self.next_sample()
+        # min-heap of the longest lifetimes seen, as (allocations, seconds, finger, size)
+        self.longest = []
+        # (seconds, allocations, frees, live arrays, live words)
+        self.timeline = [self.point()]
+
+    def next_sample(self):
+        return random.randint(1, 2 * self.sample - 1)
+
+    def point(self):
+        return (
+            time.perf_counter() - self.started,
+            self.allocs,
+            self.frees,
+            self.live_arrays,
+            self.live_words,
+        )
+
+    def on_alloc(self, ident, size, finger):
+        self.allocs += 1
+        self.live_arrays += 1
+        self.live_words += size
+        if self.live_words > self.peak_words:
+            self.peak_words = self.live_words
+
+        cls = size.bit_length()
+        try:
+            stats = self.classes[cls]
+            stats[0] += 1
+            stats[1] += size
+        except KeyError:
+            self.classes[cls] = [1, size]
+
+        try:
+            stats = self.sites[finger]
+            stats[0] += 1
+            stats[1] += size
+        except KeyError:
+            self.sites[finger] = [1, size, 0]
+
+        self.countdown -= 1
+        if not self.countdown:
+            self.countdown = self.next_sample()
+            self.births[ident] = (self.allocs, time.perf_counter(), finger, size)
+
+        if self.allocs % self.every == 0:
+            self.timeline.append(self.point())
+
+    def on_replace(self, old_size, size):
+        """
+        Array 0 was replaced by a copy of another array, which is not an allocation
+        """
+        self.live_words += size - old_size
+        if self.live_words > self.peak_words:
+            self.peak_words = self.live_words
+
+    def on_free(self, ident, size):
+        self.frees += 1
+        self.live_arrays -= 1
+        self.live_words -= size
+
+        birth = self.births.pop(ident, None)
+        if birth:
+            clock, started, finger, _ = birth
+            self.sites[finger][2] += 1
+            lifetime = (self.allocs - clock, time.perf_counter() - started, finger, size)
+            if len(self.longest) < self.top:
+                heapq.heappush(self.longest, lifetime)
+            else:
+                heapq.heappushpop(self.longest, lifetime)
+
+    def snapshot(self):
+        elapsed = time.perf_counter() - self.started
+        now = time.perf_counter()
+
+        # Sampled arrays that are still alive, oldest first: leak suspects
+        live = sorted(
+            (self.allocs - clock, now - started, finger, size)
+            for clock, started, finger, size in self.births.values()
+        )[::-1][: self.top]
+
+        return {
+            "elapsed": elapsed,
+            "sample": self.sample,
+            "allocs": self.allocs,
+            "frees": self.frees,
+            "alloc_rate": self.allocs / elapsed if elapsed else 0,
+            "live_arrays": self.live_arrays,
+            "live_bytes": 4 * self.live_words,
+            "peak_bytes": 4 * self.peak_words,
+            "classes": {
+                size_class_label(k): {"allocs": n, "bytes": 4 * w}
+                for k, (n, w) in sorted(self.classes.items())
+            },
+            "sites": {
+                f"{k:08x}": {"allocs": n, "bytes": 4 * w, "sampled_frees": f}
+                for k, (n, w, f) in sorted(
+                    self.sites.items(), key=lambda kv: kv[1][0], reverse=True
+                )
+            },
+            "longest_lived": [
+                {"allocs": a, "seconds": s, "site": f"{f:08x}", "bytes": 4 * w}
+                for a, s, f, w in sorted(self.longest, reverse=True)
+            ],
+            "oldest_live": [
+                {"allocs": a, "seconds": s, "site": f"{f:08x}", "bytes": 4 * w}
+                for a, s, f, w in live
+            ],
+            "timeline": [
+                {
+                    "seconds": s,
+                    "allocs": a,
+                    "frees": f,
+                    "live_arrays": n,
+                    "live_bytes": 4 * w,
+                }
+                for s, a, f, n, w in [*self.timeline, self.point()]
+            ],
+        }
+
+    def report(self, count=10):
+        """
+        Return a human-readable summary as a list of lines
+        """
+        snap = self.snapshot()
+        lines = [
+            f"{snap['allocs']} allocations, {snap['frees']} frees in {snap['elapsed']:.1f}s "
+            f"({snap['alloc_rate']:.0f} allocs/s)",
+            f"{snap['live_arrays']} live arrays, {snap['live_bytes']} live bytes "
+            f"(peak {snap['peak_bytes']})",
+            "size classes (words): allocs, bytes",
+        ]
+
+        for k, v in snap["classes"].items():
+            lines.append(f"  {k:>15s}: {v['allocs']:10d} {v['bytes']:12d}")
+
+        lines.append("top allocation sites: allocs, bytes")
+        for k, v in list(snap["sites"].items())[:count]:
+            lines.append(f"  {k}: {v['allocs']:10d} {v['bytes']:12d}")
+
+        lines.append(f"longest lifetimes (1 array in {snap['sample']}): allocs, site, bytes")
+        for v in snap["longest_lived"][:count]:
+            lines.append(f"  {v['allocs']:10d} {v['site']} {v['bytes']:12d}")
+
+        lines.append(f"oldest live arrays (1 array in {snap['sample']}): allocs, site, bytes")
+        for v in snap["oldest_live"][:count]:
+            lines.append(f"  {v['allocs']:10d} {v['site']} {v['bytes']:12d}")
+
+        return lines
+
+    def dump(self, filename):
+        with open(filename, mode="w") as f:
+            json.dump(self.snapshot(), f, indent=2)
@@ -0,0 +1,125 @@
+"""
+Per-phase timing and counters for UM sessions
+"""
+
+import json
+import time
+from contextlib import contextmanager
+
+
+# Phases that are timed explicitly; execution time is whatever remains
+PHASES = ("input", "solver", "save", "load")
+
+
+class Metrics:
+    """
+    Accumulates time spent in each phase of a session, as well as counters
+    (instructions, I/O bytes, solver calls...) and gauges (heap size...).
+
+    When a log file is set, a JSON line with a snapshot of all metrics is
+    appended to it at most every <interval> seconds (see .tick()).
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.times = {p: 0.0 for p in PHASES}
+        self.calls = {p: 0 for p in PHASES}
+        self.counters = {}
+        self.gauges = {}
+        self.current = None
+
+        self.log_file = None
+        self.log_interval = 10
+        self.last_log = self.started
+
+    @contextmanager
+    def phase(self, name):
+        """
+        Time the enclosed block as <name>. Nested phases are not counted
+        twice: only the outermost one accumulates time.
+        """
+        if self.current:
+            yield
+            return
+
+        self.current = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + time.perf_counter() - start
+            self.calls[name] = self.calls.get(name, 0) + 1
+            self.current = None
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, value):
+        self.gauges[name] = value
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def snapshot(self):
+        elapsed = self.elapsed
+        times = dict(self.times)
+        times["exec"] = max(0.0, elapsed - sum(times.values()))
+
+        return {
+            "time": time.time(),
+            "elapsed": elapsed,
+            "phases": {
+                k: {"seconds": v, "calls": self.calls.get(k, 0)}
+                for k, v in times.items()
+            },
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+        }
+
+    def report(self):
+        """
+        Return a human-readable report as a list of lines
+        """
+        snap = self.snapshot()
+        elapsed = snap["elapsed"]
+        lines = [f"elapsed {elapsed:.3f}s"]
+
+        for k, v in snap["phases"].items():
+            share = 100 * v["seconds"] / elapsed if elapsed else 0
+            calls = f" in {v['calls']} calls" if k != "exec" else ""
+            lines.append(f"  {k:8s} {v['seconds']:10.3f}s {share:5.1f}%{calls}")
+
+        instructions = snap["counters"].get("instructions", 0)
+        exec_time = snap["phases"]["exec"]["seconds"]
+        if instructions and exec_time:
+            lines.append(f"  {'speed':8s} {instructions / exec_time:10.0f} instr/s")
+
+        for k, v in sorted({**snap["counters"], **snap["gauges"]}.items()):
+            lines.append(f"  {k:20s} {v}")
+
+        return lines
+
+    def start_log(self, path, interval=10):
+        self.stop_log()
+        self.log_file = open(path, mode="a")
+        self.log_interval = interval
+        self.log()
+
+    def stop_log(self):
+        if self.log_file:
+            self.log()
+            self.log_file.close()
+            self.log_file = None
+
+    def log(self):
+        self.last_log = time.perf_counter()
+        if self.log_file:
+            self.log_file.write(json.dumps(self.snapshot()) + "\n")
+            self.log_file.flush()
+
+    def due(self):
+        return (
+            self.log_file is not None
+            and time.perf_counter() - self.last_log >= self.log_interval
+        )
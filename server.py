@@ -0,0 +1,364 @@
+"""
+Local socket server hosting UM sessions
+
+Each connection gets its own machine, copied from a template that is loaded
+once from a binary or a saved state. The connection is a plain text terminal:
+machine output is sent as is, and lines received are fed to the machine input,
+including machine commands, except the ones reading or writing server files.
+
+Sessions are scheduled cooperatively in a single thread: each one runs for a
+slice of instructions in turn, and is suspended while it waits for input or
+while its client does not read its output fast enough.
+"""
+
+from contextlib import redirect_stdout
+import io
+import os
+import selectors
+import socket
+import struct
+
+from um import UM, Halt, TICK
+
+
+# Instructions run by a session before yielding to the next one
+SLICE = 4 * TICK
+
+# Stop running a session when this much output is waiting to be sent, and
+# resume when it drops below LOW_WATER
+HIGH_WATER = 1 << 20
+LOW_WATER = 1 << 16
+
+# Stop reading from a client when this much input is waiting to be consumed,
+# sessions are closed when it holds no complete line
+MAX_INPUT = 1 << 16
+
+RECV_SIZE = 1 << 14
+
+# Machine commands (with their arguments) reading or writing files on the
+# server, not available to clients
+FILE_COMMANDS = (
+    (".save",),
+    (".load",),
+    (".bin",),
+    (".stats", "log"),
+    (".heap", "dump"),
+)
+
+
+class WaitInput(Exception):
+    pass
+
+
+class Yield(Exception):
+    pass
+
+
+class QuotaExceeded(Exception):
+    pass
+
+
+class SessionOutput(io.TextIOBase):
+    """
+    Text stream appending to a session output buffer, used in place of stdout
+    """
+
+    def __init__(self, buf):
+        self.buf = buf
+
+    def writable(self):
+        return True
+
+    def write(self, s):
+        self.buf += s.encode("latin-1", errors="replace")
+        return len(s)
+
+
+class Session(UM):
+    def __init__(self, ident, sock, template, quota=None):
+        super().__init__()
+
+        self.ident = ident
+        self.sock = sock
+        self.quota = quota
+        self.executed = 0
+        self.budget = 0
+
+        self.inbuf = bytearray()
+        self.outbuf = bytearray()
+        self.out = SessionOutput(self.outbuf)
+        self.waiting = False
+        self.throttled = False
+        self.eof = False
+        self.closing = False
+
+        self.copy_from(template)
+        if self.last_output:
+            self.out.write(self.last_output)
+
+    def runnable(self):
+        return not (self.closing or self.waiting or self.throttled)
+
+    def update_throttle(self):
+        if len(self.outbuf) > HIGH_WATER:
+            self.throttled = True
+        elif len(self.outbuf) < LOW_WATER:
+            self.throttled = False
+
+    def read_line(self):
+        i = self.inbuf.find(b"\n")
+
+        if i < 0:
+            # The session ends when the client is done writing and all its
+            # input was consumed
+            if self.eof:
+                self.closing = True
+
+            # Re-execute the input operation when resumed
+            self.finger -= 1
+            raise WaitInput()
+
+        line = self.inbuf[:i].decode("latin-1").rstrip("\r")
+        del self.inbuf[: i + 1]
+        return line
+
+    def handle_command(self, cmd):
+        words = cmd.split(" ")
+        for prefix in FILE_COMMANDS:
+            if tuple(words[: len(prefix)]) == prefix:
+                print(f"< {' '.join(prefix)} is not available in server sessions")
+                return
+
+        return super().handle_command(cmd)
+
+    def feed(self, data):
+        self.inbuf += data
+        if b"\n" in data:
+            self.waiting = False
+        elif len(self.inbuf) >= MAX_INPUT and b"\n" not in self.inbuf:
+            # No more input will be read, the machine would wait forever
+            self.out.write(f"< input line longer than {MAX_INPUT} bytes\n")
+            self.closing = True
+
+    def tick(self, steps):
+        super().tick(steps)
+
+        self.executed += steps
+        if self.quota and self.executed >= self.quota:
+            raise QuotaExceeded()
+
+        self.budget -= steps
+        if self.budget <= 0:
+            raise Yield()
+
+    def settle(self, steps):
+        super().settle(steps)
+
+        # Sessions often wait for input before a full tick, charge them anyway
+        self.executed += steps
+        self.budget -= steps
+
+    def step(self, budget=SLICE):
+        """
+        Run the machine for about <budget> instructions, until it waits for input,
+        or until it halts (in which case the session is closing)
+        """
+        self.budget = budget
+
+        with redirect_stdout(self.out):
+            try:
+                self.run()
+            except Yield:
+                pass
+            except WaitInput:
+                self.waiting = True
+            except Halt:
+                print("Machine halted")
+                self.closing = True
+            except QuotaExceeded:
+                print(f"< instruction quota of {self.quota} exceeded")
+                self.closing = True
+            except Exception as e:
+                print(f"< machine error: {e!r}")
+                self.closing = True
+
+            if self.quota and self.executed >= self.quota and not self.closing:
+                print(f"< instruction quota of {self.quota} exceeded")
+                self.closing = True
+
+        self.update_throttle()
+
+
+class Server:
+    """
+    Host sessions for connections on <address>, which is either the path of a
+    Unix domain socket (when it contains a '/') or a localhost TCP port.
+    """
+
+    def __init__(self, template, address, quota=None):
+        self.template = template
+        self.address = address
+        self.quota = quota
+        self.selector = selectors.DefaultSelector()
+        self.sessions = {}
+        self.next_session = 1
+        self.sock = None
+
+    def listen(self):
+        if "/" in self.address:
+            if os.path.exists(self.address):
+                os.unlink(self.address)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.bind(self.address)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("127.0.0.1", int(self.address)))
+
+        sock.listen()
+        sock.setblocking(False)
+        self.selector.register(sock, selectors.EVENT_READ, None)
+        self.sock = sock
+
+        print(f"< serving UM sessions on {self.address}")
+
+    def serve_forever(self):
+        self.listen()
+
+        try:
+            while True:
+                runnable = [s for s in self.sessions.values() if s.runnable()]
+
+                for key, events in self.selector.select(0 if runnable else None):
+                    if key.data is None:
+                        self.accept()
+                        continue
+
+                    session = key.data
+                    if events & selectors.EVENT_READ:
+                        self.receive(session)
+                    if events & selectors.EVENT_WRITE:
+                        self.send(session)
+
+                for session in runnable:
+                    if session.runnable():
+                        session.step()
+
+                for session in list(self.sessions.values()):
+                    self.update(session)
+        finally:
+            for session in list(self.sessions.values()):
+                self.close(session)
+            self.selector.close()
+            # Listening may have failed, leave the address alone then
+            if self.sock is not None:
+                self.sock.close()
+                if "/" in self.address:
+                    os.unlink(self.address)
+
+    def accept(self):
+        try:
+            conn, addr = self.sock.accept()
+        except BlockingIOError:
+            return
+
+        conn.setblocking(False)
+        ident = self.next_session
+        self.next_session += 1
+
+        session = Session(ident, conn, self.template, self.quota)
+        self.sessions[ident] = session
+        self.selector.register(conn, selectors.EVENT_READ, session)
+
+        print(f"< session {ident} started ({len(self.sessions)} active)")
+
+    def receive(self, session):
+        try:
+            data = session.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            data = b""
+
+        if data:
+            session.feed(data)
+        else:
+            # Client is done writing: let the machine consume what is left
+            session.eof = True
+            session.waiting = False
+
+    def send(self, session):
+        try:
+            sent = session.sock.send(session.outbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            session.outbuf.clear()
+            session.closing = True
+            return
+
+        del session.outbuf[:sent]
+        session.update_throttle()
+
+    def update(self, session):
+        """
+        Close finished sessions once their output is sent, and update
+        selector events for the others
+        """
+        if session.closing and not session.outbuf:
+            self.close(session)
+            return
+
+        events = 0
+        if not session.eof and not session.closing and len(session.inbuf) < MAX_INPUT:
+            events |= selectors.EVENT_READ
+        if session.outbuf:
+            events |= selectors.EVENT_WRITE
+
+        key = self.selector.get_map().get(session.sock)
+        current = key.events if key else 0
+
+        if events == current:
+            return
+        if not events:
+            self.selector.unregister(session.sock)
+        elif not current:
+            self.selector.register(session.sock, events, session)
+        else:
+            self.selector.modify(session.sock, events, session)
+
+    def close(self, session):
+        del self.sessions[session.ident]
+        if session.sock in self.selector.get_map():
+            self.selector.unregister(session.sock)
+        session.sock.close()
+
+        print(
+            f"< session {session.ident} closed after {session.executed} instructions "
+            f"({len(self.sessions)} active)"
+        )
+
+
+def load_template(filename):
+    """
+    Load a machine from a binary or a saved state, depending on its contents
+    """
+    template = UM()
+
+    with open(filename, mode="rb") as f:
+        magic = f.read(4)
+
+    if len(magic) == 4 and struct.unpack(">3sB", magic)[0] == b"umS":
+        template.cmd_load(filename)
+    else:
+        template.load(filename)
+
+    return template
+
+
+def serve(filename, address="7777", quota=None):
+    server = Server(load_template(filename), address, quota)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("< server stopped")
@@ -0,0 +1,578 @@
+"""
+Benchmarks for adventure solver components, on generated data
+
+Usage: python -m solvers.adventure.bench [name...]
+"""
+
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from .entities import GameState, build, item_from_name
+from .entities.compact import RepairSpace
+from .entities.compat import CompatibilityMatrix
+from .entities.condition import Condition
+from .entities.factories import build_ml
+from .entities.inventory import Inventory
+from .entities.item import Item
+from .entities.pile import Pile
+from .entities.room import Room
+from .errors import Unfixable
+from .explore import ChicagoExplorer, NavIndex
+from .ml import parse_ml, tokenize
+from .solvers.astarrepair import AstarRepairSolver
+from .solvers.plan import PlanRepairSolver
+from ..lib import DominanceIndex, Search
+from ..lib.route import held_karp, nearest_neighbour, route_length, two_opt
+
+
+BENCHMARKS = {}
+
+
+def benchmark(name):
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+
+    return decorator
+
+
+def best_time(func, repeat=5):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+NAMES = ["bolt", "spring", "button", "processor", "radio", "cache", "antenna"]
+NAMES += ["transistor", "screw", "motherboard", "keypad", "pill", "crowbar"]
+ADJECTIVES = ["red", "blue", "green", "orange", "magenta", "taupe", "heavy"]
+
+
+def condition_ml(rng, depth=0):
+    if depth > 1 or rng.random() < 0.6:
+        return "(pristine nil)"
+
+    missing = "".join(
+        f'((kind (name "{rng.choice(NAMES)}") (condition {condition_ml(rng, depth + 1)})))::'
+        for _ in range(rng.randint(1, 3))
+    )
+    return f"(broken (condition (pristine nil)) (missing {missing}nil))"
+
+
+def item_ml(rng, piled_on):
+    adjectives = "".join(
+        f'((adjective "{a}"))::' for a in rng.sample(ADJECTIVES, rng.randint(0, 2))
+    )
+    return (
+        f'(item (name "{rng.choice(NAMES)}") '
+        f'(description "a \\"{rng.choice(NAMES)}\\" with ABCDE.FGH=1@2|{"0a" * 10}") '
+        f"(adjectives {adjectives}nil) "
+        f"(condition {condition_ml(rng)}) "
+        f"(piled_on {f'({piled_on})::nil' if piled_on else 'nil'}))"
+    )
+
+
+def room_ml(rng, depth):
+    """
+    ML output of a 'look' command in a room with a pile of <depth> items
+    """
+    pile = None
+    for _ in range(depth):
+        pile = item_ml(rng, pile)
+
+    return (
+        f'(success (command (look (room (name "Junk Room") '
+        f'(description "a room full of junk") '
+        f"(items {f'({pile})::nil' if pile else 'nil'})))))"
+    )
+
+
+def ml_output(size, depth=40, seed=0):
+    """
+    About <size> chars of ML output made of several 'look' results
+    """
+    rng = random.Random(seed)
+    lines = []
+    total = 0
+    while total < size:
+        lines.append(room_ml(rng, depth))
+        total += len(lines[-1]) + 1
+    return "\n".join(lines) + "\n"
+
+
+def repair_world(rng, parts=4, trash=12):
+    """
+    Game state with a broken keypad missing <parts> components, one of them
+    broken too, spread with <trash> unrelated items over two rooms
+    """
+    pristine = Condition(False)
+    names = rng.sample([n for n in NAMES if n != "keypad"], parts + 1)
+    others = [n for n in NAMES if n not in names and n != "keypad"]
+    sub = Item(names[0], "", pristine)
+    parts = [Item(n, "", pristine) for n in names[1:]]
+    parts[0] = Item(parts[0].name, "", Condition(True, pristine, frozenset([sub])))
+    keypad = Item(
+        "keypad",
+        "",
+        Condition(True, pristine, frozenset(Item(p.name, "", pristine) for p in parts)),
+    )
+    junk = [
+        Item(rng.choice(others), rng.choice(ADJECTIVES), pristine) for _ in range(trash)
+    ]
+
+    items = [keypad, sub, *parts, *junk]
+    rng.shuffle(items)
+    half = len(items) // 2
+    return GameState(
+        (0, 0),
+        Inventory(()),
+        (
+            ((0, 0), Room("Junk Room", Pile(tuple(items[:half])))),
+            ((0, 1), Room("Room With a Door", Pile(tuple(items[half:])))),
+        ),
+    )
+
+
+def tree_world(rng, junk=60):
+    """
+    Game state with a broken downloader needing three levels of repairs, with
+    decoys of the same names and <junk> unrelated items, spread over the first
+    rooms of the Chicago map
+    """
+    pristine = Condition(False)
+    names = rng.sample(NAMES, 12)
+    generic = lambda n: Item(n, "", pristine)
+    broken = lambda *parts: Condition(True, pristine, frozenset(map(generic, parts)))
+
+    # downloader <- 0 <- 4, 5 | 1 <- 6 <- 7 | 2 <- 8, 9 | 3, with decoys of 0, 3
+    # and 8, the last one missing 11
+    conditions = [
+        ("downloader", broken(*names[:4])),
+        (names[0], broken(names[4], names[5])),
+        (names[1], broken(names[6])),
+        (names[6], broken(names[7])),
+        (names[2], broken(names[8], names[9])),
+        *((names[i], pristine) for i in (3, 4, 5, 7, 8, 9, 3, 11)),
+        (names[0], broken(names[4], names[5], names[10])),
+        (names[8], broken(names[11])),
+    ]
+    conditions += [(rng.choice(NAMES), pristine) for _ in range(junk)]
+
+    # Full names must be unique for commands to be unambiguous
+    items = []
+    for name, condition in conditions:
+        adj = rng.choice(ADJECTIVES)
+        while any(i.name == name and i.adj == adj for i in items):
+            adj = f"{rng.choice(ADJECTIVES)}-{rng.choice(ADJECTIVES)}"
+        items.append(Item(name, adj if name != "downloader" else "", condition))
+    rng.shuffle(items)
+
+    return chicago_world(rng, items, 5)
+
+
+def chicago_world(rng, items, rooms):
+    """
+    Game state with <items> spread over the first <rooms> rooms of the Chicago
+    map, starting in the first one
+    """
+    positions = sorted(ChicagoExplorer.navigation().rooms)
+    piles = {pos: [] for pos in positions}
+    for item in items:
+        piles[rng.choice(positions[:rooms])].append(item)
+
+    name = lambda x, y: (
+        f"{ChicagoExplorer.STREETS_Y[y]} and {ChicagoExplorer.STREETS_X[x]} Avenue"
+    )
+    return GameState(
+        positions[0],
+        Inventory(()),
+        tuple(
+            (pos, Room(name(*pos), Pile(tuple(piles[pos])))) for pos in positions
+        ),
+    )
+
+
+def grid_map(rng, width, height, holes=0.2):
+    """
+    Navigation index of a grid map with a fraction of <holes> missing rooms
+    """
+    grid = {(x, y) for x in range(width) for y in range(height)}
+    while True:
+        rooms = grid - set(rng.sample(sorted(grid - {(0, 0)}), int(holes * len(grid))))
+        edges = [
+            {(x, y), (x + dx, y + dy)}
+            for x, y in rooms
+            for dx, dy in ((0, 1), (1, 0))
+            if (x + dx, y + dy) in rooms
+        ]
+        nav = NavIndex(edges)
+        if (0, 0) in nav.index:
+            break
+
+    # Only keep rooms connected to the start
+    connected = [r for r in nav.rooms if nav.distance((0, 0), r) is not None]
+    return NavIndex([e for e in edges if e <= set(connected)])
+
+
+@benchmark("ml")
+def bench_ml():
+    """
+    ML tokenizer and parser throughput on growing outputs
+    """
+    print(f"{'size':>10s} {'tokenize':>12s} {'parse':>12s} {'parse last':>12s}")
+    for size in (10_000, 100_000, 1_000_000):
+        output = ml_output(size)
+        t_tok = best_time(lambda: tokenize(output))
+        t_all = best_time(lambda: parse_ml(output, last_stream_only=False))
+        t_last = best_time(lambda: parse_ml(output))
+        print(
+            f"{len(output):10d} {len(output) / t_tok / 1e6:8.2f}MB/s"
+            f" {len(output) / t_all / 1e6:8.2f}MB/s {len(output) / t_last / 1e6:8.2f}MB/s"
+        )
+
+
+@benchmark("entities")
+def bench_entities():
+    """
+    Building entities from ML output, from parsed trees or while parsing
+    """
+    output = ml_output(1_000_000)
+
+    def from_trees():
+        return build_ml(parse_ml(output, last_stream_only=False)[0])
+
+    def while_parsing():
+        return parse_ml(output, last_stream_only=False, build=build)[0]
+
+    for name, func in (("from trees", from_trees), ("while parsing", while_parsing)):
+        t = best_time(func, repeat=3)
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f"{name:>15s}: {t:.3f}s, peak memory {peak / 1e6:.1f}MB")
+
+
+@benchmark("route")
+def bench_route():
+    """
+    Exploration routes, exact (Held-Karp) or nearest neighbour then 2-opt
+    """
+    print(
+        f"{'rooms':>6s} {'held-karp':>10s} {'length':>7s} {'nn+2opt':>10s} {'length':>7s}"
+    )
+    rng = random.Random(0)
+    for width, height in ((3, 3), (4, 4), (4, 5), (5, 4), (8, 8), (12, 12), (16, 16)):
+        nav = grid_map(rng, width, height)
+        rooms = nav.rooms
+        line = f"{len(rooms):6d}"
+
+        if len(rooms) <= 17:
+            t = best_time(lambda: held_karp((0, 0), rooms, nav.distance), repeat=1)
+            route = held_karp((0, 0), rooms, nav.distance)
+            line += f" {t:9.3f}s {route_length(route, nav.distance):7d}"
+        else:
+            line += f" {'-':>10s} {'-':>7s}"
+
+        heuristic = lambda: two_opt(
+            nearest_neighbour((0, 0), rooms, nav.distance), nav.distance
+        )
+        t = best_time(heuristic, repeat=1)
+        line += f" {t:9.3f}s {route_length(heuristic(), nav.distance):7d}"
+        print(line)
+
+
+@benchmark("astar")
+def bench_astar():
+    """
+    Repair search speed-up with the number of parallel workers
+    """
+    print(f"{os.cpu_count()} CPUs")
+    print(f"{'workers':>8s} {'time':>8s} {'speed-up':>9s} {'expanded':>9s} {'cost':>5s}")
+
+    serial = None
+    for workers in (1, 2, 4, 8):
+        messages = []
+        solver = AstarRepairSolver(messages.append, ["keypad"], workers)
+        state = repair_world(random.Random(0))
+
+        start = time.perf_counter()
+        commands = solver.solve(state, [item_from_name("keypad")])
+        elapsed = time.perf_counter() - start
+        serial = serial or elapsed
+
+        expanded = messages[-1].split()[1]
+        print(
+            f"{workers:8d} {elapsed:7.2f}s {serial / elapsed:8.2f}x {expanded:>9s}"
+            f" {len(commands):5d}"
+        )
+
+
+@benchmark("heuristic")
+def bench_heuristic():
+    """
+    Repair search expanded states and time with each heuristic
+    """
+    heuristics = ("off", "bound", "pdb")
+    print(
+        f"{'parts':>6s} {'trash':>6s}"
+        + "".join(f" {h:>9s} {'time':>8s}" for h in heuristics)
+        + f" {'cost':>5s}"
+    )
+    for parts, trash in ((3, 16), (4, 12), (5, 8), (6, 12)):
+        line = f"{parts:6d} {trash:6d}"
+        for heuristic in heuristics:
+            messages = []
+            solver = AstarRepairSolver(messages.append, ["keypad"], heuristic=heuristic)
+            state = repair_world(random.Random(0), parts, trash)
+
+            start = time.perf_counter()
+            commands = solver.solve(state, [item_from_name("keypad")])
+            elapsed = time.perf_counter() - start
+
+            line += f" {messages[-1].split()[1]:>9s} {elapsed:7.2f}s"
+        print(f"{line} {len(commands):5d}")
+
+
+@benchmark("plan")
+def bench_plan():
+    """
+    Planner solving time and solution length on multi-level repairs
+    """
+    print(f"{'seed':>5s} {'time':>8s} {'searches':>9s} {'expanded':>9s} {'cost':>5s}")
+    for seed in range(5):
+        messages = []
+        solver = PlanRepairSolver(messages.append, ["downloader"])
+        state = tree_world(random.Random(seed))
+
+        start = time.perf_counter()
+        commands = solver.solve(state, [item_from_name("downloader")])
+        elapsed = time.perf_counter() - start
+
+        expanded = sum(int(m.split(": ")[-1].split()[0]) for m in messages)
+        cost = "-" if commands is None else str(len(commands))
+        print(f"{seed:5d} {elapsed:7.2f}s {len(messages):9d} {expanded:9d} {cost:>5s}")
+
+
+@benchmark("por")
+def bench_por():
+    """
+    Repair search expanded states with and without partial-order reduction of
+    moves, on keypad repairs spread over Chicago rooms. See check.py for checks
+    that both find the same optimal costs.
+    """
+    print(
+        f"{'rooms':>6s} {'parts':>6s}"
+        + "".join(f" {m:>9s} {'time':>8s} {'cost':>5s}" for m in ("full", "reduced"))
+    )
+    requirements = [item_from_name("keypad")]
+    for rooms, parts in ((4, 3), (6, 3), (8, 3), (13, 2)):
+        rng = random.Random(0)
+        items = [i for _, r in repair_world(rng, parts, 8).rooms for i in r.pile.items]
+        state = chicago_world(rng, items, rooms)
+        trash = AstarRepairSolver(None, ["keypad"]).trash(state, requirements)
+
+        line = f"{rooms:6d} {parts:6d}"
+        for reduce in (False, True):
+            space = RepairSpace(state, trash, reduce, macros=False)
+            search = Search(
+                space.start,
+                space.goal(requirements),
+                space.successors,
+                space.heuristic(requirements),
+            )
+
+            start = time.perf_counter()
+            goal = search.run()
+            elapsed = time.perf_counter() - start
+
+            cost = len(space.commands(search.actions(goal)))
+            line += f" {search.stats.expanded:9d} {elapsed:7.2f}s {cost:5d}"
+        print(line)
+
+
+@benchmark("macros")
+def bench_macros():
+    """
+    Repair search expanded states and solution depth (actions) with single
+    moves and with macro actions, on keypad repairs spread over Chicago rooms
+    """
+    print(
+        f"{'rooms':>6s} {'parts':>6s}"
+        + "".join(
+            f" {m:>9s} {'depth':>6s} {'time':>8s}" for m in ("moves", "macros")
+        )
+        + f" {'cost':>5s}"
+    )
+    requirements = [item_from_name("keypad")]
+    for rooms, parts in ((4, 3), (6, 3), (8, 3), (13, 2)):
+        rng = random.Random(0)
+        items = [i for _, r in repair_world(rng, parts, 8).rooms for i in r.pile.items]
+        state = chicago_world(rng, items, rooms)
+        trash = AstarRepairSolver(None, ["keypad"]).trash(state, requirements)
+
+        line = f"{rooms:6d} {parts:6d}"
+        costs = set()
+        for macros in (False, True):
+            space = RepairSpace(state, trash, macros=macros)
+            search = Search(
+                space.start,
+                space.goal(requirements),
+                space.successors,
+                space.heuristic(requirements),
+            )
+
+            start = time.perf_counter()
+            goal = search.run()
+            elapsed = time.perf_counter() - start
+
+            actions = search.actions(goal)
+            costs.add(len(space.commands(actions)))
+            line += f" {search.stats.expanded:9d} {len(actions):6d} {elapsed:7.2f}s"
+        print(f"{line} {'/'.join(map(str, sorted(costs))):>5s}")
+
+
+def needed_to_become(condition, other):
+    """
+    Condition.needed_to_become() as it was before Condition.needed(): recursive,
+    uncached, and raising Unfixable when <condition> cannot become <other>
+    """
+    if condition == other:
+        return []
+
+    if condition.repaired == other:
+        return list(condition.missing)
+
+    if not condition.broken and other.broken:
+        raise Unfixable(f"Cannot break {condition} item into {other}")
+
+    needed = []
+    mapped_other_missing = set()
+    for sm in condition.missing:
+        same_name = [om for om in other.missing if om.name == sm.name]
+        if not same_name:
+            needed.append(sm)
+            continue
+
+        if len(same_name) > 1:
+            raise Exception(f"Multiple candidates for {sm} in {other}: {same_name}")
+
+        [om] = same_name
+        needed.extend(needed_to_become(sm.condition, om.condition))
+        mapped_other_missing.add(om)
+
+    unmapped = other.missing - mapped_other_missing
+    if unmapped:
+        raise Unfixable(f"Cannot add missing items {unmapped} to become {other}")
+
+    return needed
+
+
+def can_become(condition, other):
+    """
+    Condition.can_become() as it was before Condition.needed()
+    """
+    try:
+        needed_to_become(condition, other)
+    except Unfixable:
+        return False
+    return True
+
+
+@benchmark("compat")
+def bench_compat():
+    """
+    Item compatibility checks of all items against generic items of the same
+    name, raising and catching Unfixable as before Condition.needed(), with its
+    cache and with a CompatibilityMatrix, and requirement expansion of repair
+    searches with cold and warm caches
+    """
+    print(
+        f"{'items':>6s} {'pairs':>7s} {'baseline':>9s} {'cached':>9s}"
+        f" {'matrix':>9s} {'build':>8s} {'expand':>8s} {'again':>8s}"
+    )
+    for seed in range(3):
+        state = tree_world(random.Random(seed), junk=200)
+        items = state.all_items
+        generic = {i.as_generic() for i in items}
+        pairs = [(a, b) for a in items for b in generic if a.name == b.name]
+        baseline = lambda: [can_become(a.condition, b.condition) for a, b in pairs]
+        cached = lambda: [a.can_become(b) for a, b in pairs]
+
+        Condition._needed.clear()
+        start = time.perf_counter()
+        compat = CompatibilityMatrix(items)
+        build = time.perf_counter() - start
+        matrix = lambda: [compat.can_become(a, b) for a, b in pairs]
+
+        Condition._needed.clear()
+        solver = AstarRepairSolver(None, ["downloader"])
+        expand = lambda: solver.trash(state, [item_from_name("downloader")])
+        start = time.perf_counter()
+        expand()
+        cold = time.perf_counter() - start
+
+        print(
+            f"{len(items):6d} {len(pairs):7d}"
+            f" {best_time(baseline) * 1e3:7.2f}ms {best_time(cached) * 1e3:7.2f}ms"
+            f" {best_time(matrix) * 1e3:7.2f}ms {build * 1e3:6.2f}ms"
+            f" {cold * 1e3:6.2f}ms {best_time(expand) * 1e3:6.2f}ms"
+        )
+
+
+@benchmark("dominance")
+def bench_dominance():
+    """
+    Repair search expanded states without and with dominance pruning, states
+    pruned and dominance checks, on keypad repairs in one and several rooms,
+    with single moves
+    """
+    print(
+        f"{'rooms':>6s} {'parts':>6s} {'trash':>6s} {'full':>9s} {'pruned':>9s}"
+        f" {'dominated':>10s} {'checks':>9s} {'time':>8s} {'cost':>5s}"
+    )
+    requirements = [item_from_name("keypad")]
+    for rooms, parts, junk in ((2, 4, 12), (2, 6, 12), (6, 3, 8), (13, 2, 8)):
+        rng = random.Random(0)
+        state = repair_world(rng, parts, junk)
+        if rooms > 2:
+            items = [i for _, r in state.rooms for i in r.pile.items]
+            state = chicago_world(rng, items, rooms)
+        trash = AstarRepairSolver(None, ["keypad"]).trash(state, requirements)
+
+        line = f"{rooms:6d} {parts:6d} {junk:6d}"
+        costs = set()
+        for pruning in (False, True):
+            space = RepairSpace(state, trash, macros=False)
+            index = DominanceIndex(space.dominance_key, space.dominates)
+            search = Search(
+                space.start,
+                space.goal(requirements),
+                space.successors,
+                space.heuristic(requirements),
+                dominance=index if pruning else None,
+            )
+
+            start = time.perf_counter()
+            goal = search.run()
+            elapsed = time.perf_counter() - start
+
+            costs.add(len(space.commands(search.actions(goal))))
+            line += f" {search.stats.expanded:9d}"
+        line += f" {search.stats.dominated:10d} {index.checks:9d} {elapsed:7.2f}s"
+        print(f"{line} {'/'.join(map(str, sorted(costs))):>5s}")
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        func = BENCHMARKS[name]
+        print(f"# {name}: {func.__doc__.strip()}")
+        func()
+        Item.reset()
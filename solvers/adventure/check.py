@@ -0,0 +1,83 @@
+"""
+Consistency checks of adventure solver components, on generated data
+
+Usage: python -m solvers.adventure.check
+
+Prints the checks that fail and exits with status 1 if any did.
+"""
+
+import random
+import sys
+
+from .bench import chicago_world, repair_world
+from .entities import GameState, item_from_name
+from .entities.compact import RepairSpace
+from .solvers.astarrepair import AstarRepairSolver
+from ..lib import Search
+
+
+# Seeded worlds the reduction of moves is checked on
+REDUCTION_SEEDS = range(40)
+
+
+def reduction_costs(state, trash, requirements):
+    """
+    Optimal costs of repairing <requirements> in <state> without and with the
+    reduction of moves, as {successors: (full, reduced)}
+    """
+    is_goal = lambda s: s.inv.matches(requirements)
+    costs = {"next_states": [], "RepairSpace": []}
+    for reduce in (False, True):
+        successors = lambda s: (
+            (n.trimmed(), len(n.commands) - len(s.commands), None)
+            for n in s.next_states(trash, reduce)
+        )
+        search = Search(state, is_goal, successors, key=GameState.canonical)
+        costs["next_states"].append(search.cost(search.run()))
+
+        space = RepairSpace(state, trash, reduce, macros=False)
+        search = Search(space.start, space.goal(requirements), space.successors)
+        costs["RepairSpace"].append(search.cost(search.run()))
+
+    return {k: tuple(v) for k, v in costs.items()}
+
+
+def check_reduction(seeds=REDUCTION_SEEDS):
+    """
+    Reduced searches find the same optimal costs as full ones, over
+    GameState.next_states() and RepairSpace successors, on small keypad repairs
+    spread over Chicago rooms. Return failures as messages.
+    """
+    requirements = [item_from_name("keypad")]
+    failures = []
+    for seed in seeds:
+        rng = random.Random(seed)
+        items = [i for _, r in repair_world(rng, 2, 4).rooms for i in r.pile.items]
+        state = chicago_world(rng, items, 6)
+        trash = AstarRepairSolver(None, ["keypad"]).trash(state, requirements)
+
+        costs = reduction_costs(state, trash, requirements)
+        for name, (full, reduced) in costs.items():
+            if full != reduced:
+                failures.append(
+                    f"seed {seed}: {name} costs {full} in full, {reduced} reduced"
+                )
+
+    return failures
+
+
+CHECKS = {
+    "reduction": check_reduction,
+}
+
+
+if __name__ == "__main__":
+    failed = False
+    for name, func in CHECKS.items():
+        failures = func()
+        print(f"# {name}: {'ok' if not failures else f'{len(failures)} failures'}")
+        for f in failures:
+            print(f)
+        failed = failed or bool(failures)
+
+    sys.exit(1 if failed else 0)
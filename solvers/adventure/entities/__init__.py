@@ -1,4 +1,5 @@
 from .factories import (
+    build,
     inventory_from_ml,
     item_from_ml,
     item_from_name,
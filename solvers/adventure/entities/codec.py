@@ -0,0 +1,38 @@
+import struct
+
+
+class StateCodec:
+    """
+    Encode compact states of RepairSpace <space> as a few bytes, and back.
+
+    Zobrist keys are left out and computed again when decoding. Room pile
+    depths and inventory item ids are encoded as 16-bit integers, and the bit
+    mask of rooms just moved from as the bytes that follow the context.
+    Encodings are only valid for the space that produced the states.
+    """
+
+    def __init__(self, space):
+        self.space = space
+        self.rooms = len(space.piles)
+        self.depths = struct.Struct(f">H{self.rooms}H")
+
+    def encode(self, state):
+        _, room, depths, inv, moved, ctx = state
+        return b"".join(
+            (
+                self.depths.pack(room, *depths),
+                struct.pack(f">B{len(inv)}Hh", len(inv), *inv, ctx),
+                moved.to_bytes((moved.bit_length() + 7) // 8, "big"),
+            )
+        )
+
+    def decode(self, data):
+        room, *depths = self.depths.unpack_from(data)
+        offset = self.depths.size
+
+        (n,) = struct.unpack_from(">B", data, offset)
+        *inv, ctx = struct.unpack_from(f">{n}Hh", data, offset + 1)
+        offset += 1 + 2 * n + 2
+
+        moved = int.from_bytes(data[offset:], "big")
+        return self.space.state(room, tuple(depths), tuple(inv), moved, ctx)
@@ -0,0 +1,616 @@
+from collections import Counter
+from itertools import product, permutations
+import math
+import random
+
+from ..errors import InvalidState
+from ..explore import DIRS, MapExplorer
+from .inventory import MAX_SIZE, Inventory
+from .pile import Pile
+from .room import Room
+from .state import GameState
+
+
+# Context values besides the id of the name of the item just taken or repaired
+CTX_START = -2
+CTX_NONE = -1
+
+# Zobrist keys are sums of random 64-bit keys of state parts
+HASH_MASK = (1 << 64) - 1
+HASH_SEED = 0x5EED
+
+# Action codes, actions are tuples of (code, arg, arg) steps
+ACT_MOVE = 0
+ACT_TAKE = 1
+ACT_INCINERATE = 2
+ACT_COMBINE = 3
+
+
+class State(tuple):
+    """
+    Compact state (zhash, room, depths, inventory, moved, context), hashed by
+    its Zobrist key. Dicts and sets holding states only compare the other
+    fields when keys collide, or to verify a hit.
+    """
+
+    __slots__ = ()
+
+    def __hash__(self):
+        return self[0]
+
+
+class RepairSpace:
+    """
+    Repair search space over compact states, reachable from GameState <initial>
+    with items in <trash> allowed to be incinerated.
+
+    States are tuples of small integers:
+        (zhash, room, depths, inventory, moved, context)
+    - zhash: Zobrist key of the other fields, updated with each action
+    - room: index of the current room
+    - depths: number of items removed from each room initial pile, piles only
+      lose items from the top
+    - inventory: sorted tuple of item ids
+    - moved: bit mask of rooms we just came from by moving, 0 if the last
+      command was not a move
+    - context: CTX_START before the first command, or the id of the name of
+      the item just taken or repaired, or CTX_NONE
+
+    States carry no commands: successors yield an action code tuple with each
+    state, and commands() turns actions back into commands. Next states and
+    their order of preference follow GameState.next_states(), except that with
+    <macros> moves are part of the actions on piles they lead to.
+    """
+
+    def __init__(self, initial, trash=(), reduce=True, macros=True):
+        self.positions = [pos for pos, _ in initial.rooms]
+        self.rooms = [room for _, room in initial.rooms]
+        self.room_ids = {pos: i for i, pos in enumerate(self.positions)}
+        self.piles = []
+
+        self.items = []
+        self.item_ids = {}
+        self.names = []
+        self.name_ids = {}
+        self.item_names = []
+        self.combined = {}
+
+        self.rng = random.Random(HASH_SEED)
+        self.z_items = []
+        self.z_moved = {}
+        self.z_context = {}
+
+        for room in self.rooms:
+            self.piles.append(tuple(self.item_id(i) for i in room.pile.items))
+
+        self.trash = {self.item_id(i) for i in trash}
+
+        # skips[r][d]: depth of room r pile once trash on top of it at depth d
+        # is destroyed
+        self.skips = []
+        for pile in self.piles:
+            skip = [len(pile)]
+            for i in reversed(pile):
+                skip.append(skip[-1] if i in self.trash else len(pile) - len(skip))
+            self.skips.append(skip[::-1])
+
+        self.z_rooms = [self.rng.getrandbits(64) for _ in self.piles]
+        self.z_depths = [
+            [self.rng.getrandbits(64) for _ in range(len(pile) + 1)]
+            for pile in self.piles
+        ]
+
+        # room -> [...(neighbour room, direction)]
+        self.moves = []
+        for pos, room in zip(self.positions, self.rooms):
+            explorer = MapExplorer.locate(room.name)
+            self.moves.append(
+                [
+                    (self.room_ids[n], DIRS[(n[0] - pos[0], n[1] - pos[1])])
+                    for n in explorer.neighbours()
+                    if n in self.room_ids
+                ]
+            )
+
+        # dist[a][b]: number of moves from room a to room b, parents[a][b]: room
+        # before b on the shortest path from a to b that moves follow
+        self.dist = []
+        self.parents = []
+        for a in range(len(self.piles)):
+            dist, parents = self.room_tree(a)
+            self.dist.append(dist)
+            self.parents.append(parents)
+
+        # With <macros>, moves are only made on the way to act on a pile, as a
+        # single action: paths[a][b] are the move steps from room a to room b
+        self.macros = macros
+        self.paths = [
+            [self.room_path(a, b) for b in range(len(self.piles))]
+            for a in range(len(self.piles))
+        ]
+
+        # With <reduce>, moves in a row only follow the shortest paths from the
+        # room they started from, which are known by the rooms they went
+        # through: (room, moved) -> starting room
+        self.reduce = reduce
+        self.origins = {}
+        for a, parents in enumerate(self.parents):
+            for b in range(len(self.piles)):
+                moved, cur = 0, b
+                while parents[cur] is not None:
+                    cur = parents[cur]
+                    moved |= 1 << cur
+                if moved:
+                    self.origins[b, moved] = a
+
+        self.start = self.state(
+            self.room_ids[initial.pos],
+            (0,) * len(self.piles),
+            tuple(sorted(self.item_id(i) for i in initial.inv.items)),
+            0,
+            CTX_START,
+        )
+
+    def item_id(self, item):
+        try:
+            return self.item_ids[item]
+        except KeyError:
+            pass
+
+        self.items.append(item)
+        name = item.full_name
+        if name not in self.name_ids:
+            self.name_ids[name] = len(self.names)
+            self.names.append(name)
+        self.item_names.append(self.name_ids[name])
+        self.z_items.append(self.rng.getrandbits(64))
+        return self.item_ids.setdefault(item, len(self.items) - 1)
+
+    def intern_all(self):
+        """
+        Intern all items combines can lead to, and draw keys for all contexts and
+        for the moves of macro or reduced searches. Ids and keys are otherwise
+        assigned as states are found, and processes forked afterwards would
+        not agree on them.
+        """
+        done = 0
+        while done < len(self.items):
+            done = len(self.items)
+            for broken in range(done):
+                for component in range(done):
+                    self.combine(broken, component)
+
+        for ctx in (CTX_START, CTX_NONE, *range(len(self.names))):
+            self.z_key(self.z_context, ctx)
+        for moved in (0, *(moved for _, moved in self.origins)):
+            self.z_key(self.z_moved, moved)
+
+    def room_tree(self, start):
+        """
+        Distances from room <start> to each room, and the room before each one
+        on a shortest path from <start> (a BFS tree, None for <start> and rooms
+        out of reach)
+        """
+        dist = [math.inf] * len(self.piles)
+        parents = [None] * len(self.piles)
+        dist[start] = 0
+        frontier = [start]
+        while frontier:
+            room = frontier.pop(0)
+            for nxt, _ in self.moves[room]:
+                if dist[nxt] == math.inf:
+                    dist[nxt] = dist[room] + 1
+                    parents[nxt] = room
+                    frontier.append(nxt)
+        return dist, parents
+
+    def room_path(self, a, b):
+        """
+        Move steps from room <a> to room <b> along a shortest path, or None
+        """
+        if self.dist[a][b] == math.inf:
+            return None
+
+        steps = []
+        cur = b
+        while cur != a:
+            prev = self.parents[a][cur]
+            direction = next(d for nxt, d in self.moves[prev] if nxt == cur)
+            steps.append((ACT_MOVE, direction, 0))
+            cur = prev
+        return tuple(reversed(steps))
+
+    def z_key(self, keys, value):
+        try:
+            return keys[value]
+        except KeyError:
+            return keys.setdefault(value, self.rng.getrandbits(64))
+
+    def state(self, room, depths, inv, moved, ctx):
+        """
+        Build a state from scratch, successors update keys incrementally
+        """
+        zhash = (
+            self.z_rooms[room]
+            + sum(z[d] for z, d in zip(self.z_depths, depths))
+            + sum(self.z_items[i] for i in inv)
+            + self.z_key(self.z_moved, moved)
+            + self.z_key(self.z_context, ctx)
+        )
+        return State((zhash & HASH_MASK, room, depths, inv, moved, ctx))
+
+    def combine(self, broken, component):
+        """
+        Id of the item <broken> becomes once combined with <component>, or None
+        """
+        try:
+            return self.combined[broken, component]
+        except KeyError:
+            pass
+
+        try:
+            item = self.items[broken]
+            repaired = item.combined_with(self.items[component])
+            result = self.item_id(repaired)
+        except InvalidState:
+            result = None
+
+        self.combined[broken, component] = result
+        return result
+
+    def dominance_key(self, state):
+        """
+        Key of states dominates() compares: same room and inventory, and piles
+        only differing by trash on top
+        """
+        _, room, depths, inv, _, _ = state
+        return room, tuple(s[d] for s, d in zip(self.skips, depths)), inv
+
+    def dominates(self, a, b):
+        """
+        Whether state <a> reaches goals in no more commands than state <b> of
+        the same dominance_key(): it destroyed at least as much trash, and the
+        next actions of <b> are allowed from <a> too, or moves to the same rooms
+        along shorter paths
+        """
+        _, _, a_depths, _, a_moved, a_ctx = a
+        _, _, b_depths, _, b_moved, b_ctx = b
+        if a_moved and a_moved != b_moved:
+            return False
+        if any(da < db for da, db in zip(a_depths, b_depths)):
+            return False
+
+        # Combines are allowed from <b> right after taking or repairing an item
+        # of the context name, from <a> too with the same context
+        if b_moved or b_ctx == CTX_NONE:
+            return True
+        return not a_moved and a_ctx in (CTX_START, b_ctx)
+
+    def goal(self, requirements):
+        """
+        is_goal(state) for states whose inventory fulfills <requirements>, one
+        inventory item for each of them
+        """
+        keys = {}
+
+        def key(i):
+            try:
+                return keys[i]
+            except KeyError:
+                item = self.items[i]
+                return keys.setdefault(i, (item.name, item.condition))
+
+        wanted = Counter((r.name, r.condition) for r in requirements)
+
+        def is_goal(state):
+            have = Counter(key(i) for i in state[3])
+            return all(have[k] >= n for k, n in wanted.items())
+
+        return is_goal
+
+    def heuristic(self, requirements):
+        """
+        h(state) lower bound on the number of commands left to fulfill
+        <requirements>, infinite when they cannot be fulfilled anymore.
+
+        Each requirement is assigned a distinct candidate item, from the
+        inventory or a pile, and the bound for an assignment adds:
+        - the combines still needed to repair candidates
+        - the takes needed: the candidates from piles, and the components not
+          available in the inventory; or if higher, the cost of clearing piles
+          down to the candidates (takes, and incinerations for trash)
+        - moves to the farthest room holding a candidate
+        The bound is the lowest over all assignments. Each command lowers it
+        by at most its cost, which makes it consistent.
+
+        Candidates costing no less than others are left out: inventory items
+        already matching a requirement are always assigned to it, and of the
+        items needing the same components, only as many as there are
+        requirements left to assign are kept, from the inventory and from the
+        top of each pile, so that distinct assignments remain possible.
+        """
+        needs = {}
+
+        def needed(i, r):
+            try:
+                return needs[i, r]
+            except KeyError:
+                pass
+            names = self.items[i].needed(r)
+            if names is not None:
+                names = tuple(n.name for n in names)
+            return needs.setdefault((i, r), names)
+
+        # clearing[room][k]: commands to clear the first k items of room pile
+        clearing = []
+        for pile in self.piles:
+            costs = [0]
+            for i in pile:
+                costs.append(costs[-1] + (2 if i in self.trash else 1))
+            clearing.append(costs)
+
+        def h(state):
+            _, room, depths, inv, _, _ = state
+
+            # Inventory items matching requirements
+            matched = {}
+            free = []
+            for r in requirements:
+                k = next(
+                    (
+                        k
+                        for k, i in enumerate(inv)
+                        if k not in matched and self.items[i].matches(r)
+                    ),
+                    None,
+                )
+                if k is None:
+                    free.append(r)
+                else:
+                    matched[k] = r
+
+            # requirement -> [...(location, needed component names)], location
+            # being the inventory index, or (room, pile index)
+            options = []
+            for r in free:
+                found = []
+                kept = Counter()
+                for k, i in enumerate(inv):
+                    names = needed(i, r)
+                    if k not in matched and names is not None:
+                        if kept[names] < len(free):
+                            kept[names] += 1
+                            found.append((k, names))
+                for p, pile in enumerate(self.piles):
+                    kept = Counter()
+                    for k in range(depths[p], len(pile)):
+                        names = needed(pile[k], r)
+                        if names is not None and kept[names] < len(free):
+                            kept[names] += 1
+                            found.append(((p, k), names))
+                if not found:
+                    return math.inf
+                options.append(found)
+
+            best = math.inf
+            for assignment in product(*options):
+                locations = [*matched, *(loc for loc, _ in assignment)]
+                if len(set(locations)) < len(locations):
+                    continue
+
+                combines = 0
+                demand = Counter()
+                for _, names in assignment:
+                    combines += len(names)
+                    demand.update(names)
+
+                deepest = {}
+                for loc in locations:
+                    if isinstance(loc, tuple):
+                        p, k = loc
+                        deepest[p] = max(deepest.get(p, k), k)
+                supply = Counter(
+                    self.items[i].name for k, i in enumerate(inv) if k not in locations
+                )
+
+                takes = sum(1 for loc in locations if isinstance(loc, tuple))
+                takes += sum(max(0, n - supply[name]) for name, n in demand.items())
+                cleared = sum(
+                    clearing[p][k + 1] - clearing[p][depths[p]]
+                    for p, k in deepest.items()
+                )
+                moves = max((self.dist[room][p] for p in deepest), default=0)
+
+                best = min(best, combines + max(takes, cleared) + moves)
+
+            return best
+
+        return h
+
+    def game_state(self, state):
+        """
+        GameState of <state>, with no commands
+        """
+        _, room, depths, inv, _, _ = state
+        return GameState(
+            self.positions[room],
+            Inventory(tuple(self.items[i] for i in inv)),
+            tuple(
+                (pos, Room(r.name, Pile(r.pile.items[d:])))
+                for pos, r, d in zip(self.positions, self.rooms, depths)
+            ),
+        )
+
+    def successors(self, state):
+        """
+        Yield (next state, number of commands, action) from <state>
+        """
+        zhash, room, depths, inv, moved, ctx = state
+        trash = self.trash
+        z_items = self.z_items
+        z_key = self.z_key
+
+        # Every action changes moved and context, start from the key without
+        # them and add the new ones
+        base = zhash - z_key(self.z_moved, moved) - z_key(self.z_context, ctx)
+        not_moved = z_key(self.z_moved, 0)
+        z_none = z_key(self.z_context, CTX_NONE)
+
+        # Start by destroying all trash items in the inventory
+        if ctx == CTX_START:
+            trashed = [i for i in inv if i in trash]
+            if trashed:
+                kept = tuple(i for i in inv if i not in trash)
+                h = base - sum(z_items[i] for i in trashed) + not_moved + z_none
+                yield (
+                    State((h & HASH_MASK, room, depths, kept, 0, CTX_NONE)),
+                    len(trashed),
+                    tuple((ACT_INCINERATE, i, 0) for i in trashed),
+                )
+
+        # Destroy trash on top of the current room pile, or take its top item
+        yield from self.pile_actions(state, base, room, ())
+
+        # Combine two items from the inventory, right after taking or repairing
+        # one of them, see GameState.next_states()
+        if not moved:
+            names = self.item_names
+            for broken, component in permutations(inv, 2):
+                if ctx != CTX_START and ctx not in (names[broken], names[component]):
+                    continue
+
+                repaired = self.combine(broken, component)
+                if repaired is None:
+                    continue
+
+                kept = [i for i in inv if i not in (broken, component)]
+                h = (
+                    base
+                    - sum(z_items[i] for i in inv if i in (broken, component))
+                    + z_items[repaired]
+                    + not_moved
+                    + z_key(self.z_context, names[broken])
+                )
+                yield (
+                    State(
+                        (
+                            h & HASH_MASK,
+                            room,
+                            depths,
+                            tuple(sorted(kept + [repaired])),
+                            0,
+                            names[broken],
+                        )
+                    ),
+                    1,
+                    ((ACT_COMBINE, broken, component),),
+                )
+
+        # Go to another room along a shortest path and act on its pile, moves
+        # alone never lead anywhere new
+        if self.macros:
+            for nxt, path in enumerate(self.paths[room]):
+                if nxt != room and path is not None:
+                    z_room = self.z_rooms[nxt] - self.z_rooms[room]
+                    yield from self.pile_actions(state, base + z_room, nxt, path)
+            return
+
+        # Move to another room, but not back to a room we just visited, nor
+        # off the shortest paths from the room moves started from
+        base += z_none - self.z_rooms[room]
+        parents = None
+        if self.reduce:
+            parents = self.parents[self.origins[room, moved] if moved else room]
+        for nxt, direction in self.moves[room]:
+            if parents is not None and parents[nxt] != room:
+                continue
+            if moved & (1 << nxt):
+                continue
+            nxt_moved = moved | (1 << room)
+            h = base + self.z_rooms[nxt] + z_key(self.z_moved, nxt_moved)
+            yield (
+                State((h & HASH_MASK, nxt, depths, inv, nxt_moved, CTX_NONE)),
+                1,
+                ((ACT_MOVE, direction, 0),),
+            )
+
+    def pile_actions(self, state, base, room, path):
+        """
+        Yield (next state, number of commands, action) for actions on the pile
+        of <room> reached from <state> with <path> move steps: destroying the
+        trash on top of it, or taking its top item. <base> is the key of the
+        state in <room>, without moved and context.
+        """
+        _, _, depths, inv, _, _ = state
+        pile = self.piles[room]
+        depth = depths[room]
+        if len(inv) >= MAX_SIZE or depth == len(pile):
+            return
+
+        z_depths = self.z_depths[room]
+        base += self.z_key(self.z_moved, 0)
+        top = self.skips[room][depth]
+
+        # Destroy all trash items on top of the pile
+        if top > depth:
+            new_depths = depths[:room] + (top,) + depths[room + 1 :]
+            h = (
+                base
+                - z_depths[depth]
+                + z_depths[top]
+                + self.z_key(self.z_context, CTX_NONE)
+            )
+            yield (
+                State((h & HASH_MASK, room, new_depths, inv, 0, CTX_NONE)),
+                len(path) + 2 * (top - depth),
+                path
+                + tuple(
+                    (code, i, 0)
+                    for i in pile[depth:top]
+                    for code in (ACT_TAKE, ACT_INCINERATE)
+                ),
+            )
+            return
+
+        # Take a non-trash item
+        taken = pile[depth]
+        new_ctx = self.item_names[taken]
+        h = (
+            base
+            - z_depths[depth]
+            + z_depths[depth + 1]
+            + self.z_items[taken]
+            + self.z_key(self.z_context, new_ctx)
+        )
+        yield (
+            State(
+                (
+                    h & HASH_MASK,
+                    room,
+                    depths[:room] + (depth + 1,) + depths[room + 1 :],
+                    tuple(sorted(inv + (taken,))),
+                    0,
+                    new_ctx,
+                )
+            ),
+            len(path) + 1,
+            path + ((ACT_TAKE, taken, 0),),
+        )
+
+    def commands(self, actions):
+        """
+        Game commands for a sequence of actions
+        """
+        name = lambda i: self.names[self.item_names[i]]
+        commands = []
+        for action in actions:
+            for code, a, b in action:
+                if code == ACT_MOVE:
+                    commands.append(a)
+                elif code == ACT_TAKE:
+                    commands.append(f"take {name(a)}")
+                elif code == ACT_INCINERATE:
+                    commands.append(f"incinerate {name(a)}")
+                elif code == ACT_COMBINE:
+                    commands.append(f"combine {name(a)} with {name(b)}")
+        return commands
@@ -0,0 +1,41 @@
+from collections import defaultdict
+
+
+class CompatibilityMatrix:
+    """
+    Item.needed() for all items of a map and all targets they may have to
+    become: the generic and pristine versions of those items, and the items
+    missing from them, recursively. Other pairs are computed on demand.
+    """
+
+    def __init__(self, items):
+        targets = set()
+        frontier = list(items)
+        while frontier:
+            item = frontier.pop()
+            for target in (item.as_generic(), item.as_pristine_generic()):
+                if target not in targets:
+                    targets.add(target)
+                    frontier.append(target)
+
+            condition = item.condition
+            while condition is not None and condition.broken:
+                frontier.extend(m for m in condition.missing if m not in targets)
+                condition = condition.repaired
+
+        by_name = defaultdict(list)
+        for target in targets:
+            by_name[target.name].append(target)
+
+        self.table = {
+            (item, target): item.needed(target)
+            for item in {*items, *targets}
+            for target in by_name[item.name]
+        }
+
+    def needed(self, item, target):
+        needed = self.table.get((item, target), self)
+        return item.needed(target) if needed is self else needed
+
+    def can_become(self, item, target):
+        return self.needed(item, target) is not None
@@ -3,13 +3,53 @@ from collections import namedtuple
 from ..errors import InvalidState, Unfixable
 
 
+# Results of Condition.needed() kept in cache
+NEEDED_CACHE_SIZE = 1 << 16
+
+
 class Condition(
     namedtuple(
         "Condition", ["broken", "repaired", "missing"], defaults=[None, frozenset()]
     )
 ):
+    """
+    Conditions are interned: building a condition equal to an existing one
+    returns the existing object, so equality and hashing are identity-based.
+    Interned conditions are kept until reset().
+    """
+
     __slots__ = ()
 
+    _interned = {}
+
+    # (condition, other) -> needed(), in insertion order
+    _needed = {}
+
+    def __new__(cls, broken, repaired=None, missing=frozenset()):
+        key = (broken, repaired, missing)
+        try:
+            return cls._interned[key]
+        except KeyError:
+            return cls._interned.setdefault(key, super().__new__(cls, *key))
+
+    @classmethod
+    def _make(cls, iterable):
+        return cls(*iterable)
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget interned conditions and needed() results, which are otherwise
+        kept for the whole process. Conditions built before are not equal to
+        the ones built after, only reset when none of them is used anymore.
+        """
+        cls._interned.clear()
+        cls._needed.clear()
+
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
     def __repr__(self):
         if not self.broken:
             return "<Pristine>"
@@ -33,15 +73,37 @@ class Condition(
         else:
             raise InvalidState(f"Cannot combine {self} with {other}")
 
-    def needed_to_become(self, other):
+    def needed(self, other):
+        """
+        Items missing from this condition to become <other>, as a tuple, or None
+        if it cannot. Results are cached by (condition, other), the oldest ones
+        are evicted once the cache is full.
+        """
+        key = (self, other)
+        cache = Condition._needed
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+
+        needed = self.find_needed(other)
+        if len(cache) >= NEEDED_CACHE_SIZE:
+            del cache[next(iter(cache))]
+        cache[key] = needed
+        return needed
+
+    def find_needed(self, other):
+        """
+        needed() without cache
+        """
         if self == other:
-            return []
+            return ()
 
         if self.repaired == other:
-            return list(self.missing)
+            return tuple(self.missing)
 
         if not self.broken and other.broken:
-            raise Unfixable(f"Cannot break {self} item into {other}")
+            return None
 
         needed = []
         mapped_other_missing = set()
@@ -55,21 +117,23 @@ class Condition(
                 raise Exception(f"Multiple candidates for {sm} in {other}: {same_name}")
 
             [om] = same_name
-            needed.extend(sm.needed_to_become(om))
+            sub = sm.needed(om)
+            if sub is None:
+                return None
+            needed.extend(sub)
             mapped_other_missing.add(om)
 
-        unmapped = other.missing - mapped_other_missing
-        if unmapped:
-            raise Unfixable(
-                f"Cannot add missing items {unmapped} in {sm} to become {other}"
-            )
+        if other.missing - mapped_other_missing:
+            return None
 
-        return needed
+        return tuple(needed)
 
-    def can_become(self, other):
-        try:
-            _ = self.needed_to_become(other)
-        except Unfixable:
-            return False
+    def needed_to_become(self, other):
+        needed = self.needed(other)
+        if needed is None:
+            raise Unfixable(f"Cannot turn {self} into {other}")
 
-        return True
+        return list(needed)
+
+    def can_become(self, other):
+        return self.needed(other) is not None
@@ -5,35 +5,95 @@ from .pile import Pile
 from .room import Room
 
 
-def get_attr(ml, attr):
+def get_condition(attrs):
+    [condition] = attrs["condition"]
+    if not isinstance(condition, Condition):
+        raise ValueError("Unhandled condition structure")
+    return condition
+
+
+def build_pristine(args):
+    return Condition(False)
+
+
+def build_broken(args):
+    attrs = dict(args)
+
+    # Unfold repaired state
+    repaired = get_condition(attrs)
+    missing = frozenset(item_from_missing_ml(m) for m in attrs["missing"])
+
+    while repaired.broken:
+        missing = frozenset(missing | repaired.missing)
+        repaired = repaired.repaired
+
+    return Condition(True, repaired, missing)
+
+
+def build_item(args):
     """
-    Fetch values from (symbol, (..., (attr, value), ..., (attr, value), ...))
+    Items are built as the pile they are on top of
     """
-    return [b for a, b in ml[1] if a == attr]
+    attrs = dict(args)
+    adj = " ".join(a for _, a in attrs["adjectives"])
+    item = Item(attrs["name"], adj, get_condition(attrs))
+
+    piled_on = attrs["piled_on"]
+    return Pile((item, *piled_on[0].items)) if piled_on else Pile((item,))
+
+
+def build_room(args):
+    attrs = dict(args)
+    name = attrs["name"]
+    piles = attrs["items"]
+    if len(piles) > 1:
+        raise ValueError(
+            f"Room {name} has {len(piles)} piles of items, expected 1 or none"
+        )
+
+    return Room(name, piles[0] if piles else Pile(()))
+
+
+BUILDERS = {
+    "pristine": build_pristine,
+    "broken": build_broken,
+    "item": build_item,
+    "room": build_room,
+}
+
+
+def build(symbol, args):
+    """
+    Build entities from ML expressions as they are parsed, see ml.parse_expr().
+    Expressions that are not entities are left as (symbol, args) tuples.
+    Raises ValueError when entities are missing attributes.
+    """
+    try:
+        builder = BUILDERS[symbol]
+    except KeyError:
+        return (symbol, args)
+
+    try:
+        return builder(args)
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Invalid {symbol} expression: {e!r}")
+
+
+def build_ml(ml):
+    """
+    Build entities from an already parsed ML tree, bottom-up. Parts of the tree
+    that are already built are left as is.
+    """
+    if type(ml) is tuple:
+        symbol, args = ml
+        return build(symbol, build_ml(args))
+    if type(ml) is list:
+        return [build_ml(m) for m in ml]
+    return ml
 
 
 def condition_from_ml(ml):
-    match ml[0]:
-        case ("pristine", *_):
-            return Condition(False)
-        case ("broken", [("condition", repaired), ("missing", missing)]):
-            # Unfold repaired state
-            repaired = condition_from_ml(repaired)
-            missing = frozenset(
-                item_from_missing(
-                    get_attr(m, "name")[0],
-                    condition_from_ml(get_attr(m, "condition")[0]),
-                )
-                for m in missing
-            )
-
-            while repaired.broken:
-                missing = frozenset(missing | repaired.missing)
-                repaired = repaired.repaired
-
-            return Condition(True, repaired, missing)
-        case _:
-            raise Exception("Unhandled condition structure")
+    return build_ml(ml[0])
 
 
 def inventory_from_ml(ml):
@@ -41,10 +101,7 @@ def inventory_from_ml(ml):
 
 
 def item_from_ml(ml):
-    name = get_attr(ml, "name")[0]
-    adj = " ".join([a[1] for a in get_attr(ml, "adjectives")[0]])
-    condition = condition_from_ml(get_attr(ml, "condition")[0])
-    return Item(name, adj, condition)
+    return build_ml(ml).top
 
 
 def item_from_name(name):
@@ -55,21 +112,14 @@ def item_from_missing(name, condition):
     return Item(name, "", condition)
 
 
+def item_from_missing_ml(ml):
+    attrs = dict(ml[1])
+    return item_from_missing(attrs["name"], get_condition(attrs))
+
+
 def pile_from_ml(ml):
-    items = ()
-    while ml:
-        items = (*items, item_from_ml(ml))
-        piled_on = get_attr(ml, "piled_on")[0]
-        ml = piled_on[0] if piled_on else None
-    return Pile(items)
+    return build_ml(ml)
 
 
 def room_from_ml(ml):
-    name = get_attr(ml, "name")[0]
-    piles = [pile_from_ml(i) for i in get_attr(ml, "items")[0]]
-    if len(piles) > 1:
-        raise Exception(
-            f"Room {name} has {len(piles)} piles of items, expected 1 or none"
-        )
-
-    return Room(name, piles[0] if piles else Pile([]))
+    return build_ml(ml)
@@ -51,7 +51,7 @@ class Inventory(namedtuple("Inventory", ["items"])):
         for i in self.items:
             if i in trash:
                 trashed.append(i)
-                cur = self.without_item(i)
+                cur = cur.without_item(i)
 
         if cur == self:
             raise InvalidState(f"Inventory has no trash items")
@@ -5,8 +5,39 @@ from .condition import Condition
 
 
 class Item(namedtuple("Item", ["name", "adj", "condition"])):
+    """
+    Items are interned: building an item equal to an existing one returns the
+    existing object, so equality and hashing are identity-based. Interned items
+    are kept until reset().
+    """
+
     __slots__ = ()
 
+    _interned = {}
+
+    def __new__(cls, name, adj, condition):
+        key = (name, adj, condition)
+        try:
+            return cls._interned[key]
+        except KeyError:
+            return cls._interned.setdefault(key, super().__new__(cls, *key))
+
+    @classmethod
+    def _make(cls, iterable):
+        return cls(*iterable)
+
+    @classmethod
+    def reset(cls):
+        """
+        Forget interned items and conditions, see Condition.reset()
+        """
+        cls._interned.clear()
+        Condition.reset()
+
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+
     def __repr__(self):
         if self.condition.broken:
             return f"<{self.full_name} {self.condition}>"
@@ -37,6 +68,16 @@ class Item(namedtuple("Item", ["name", "adj", "condition"])):
     def matches(self, other):
         return self.name == other.name and self.condition == other.condition
 
+    def needed(self, other):
+        """
+        Items missing from this item to become <other>, as a tuple, or None if
+        it cannot
+        """
+        if self.name != other.name:
+            return None
+
+        return self.condition.needed(other.condition)
+
     def needed_to_become(self, other):
         if self.name != other.name:
             raise Unfixable(f"Cannot transmute {self} into {other}")
@@ -44,9 +85,4 @@ class Item(namedtuple("Item", ["name", "adj", "condition"])):
         return self.condition.needed_to_become(other.condition)
 
     def can_become(self, other):
-        try:
-            _ = self.needed_to_become(other)
-        except Unfixable:
-            return False
-
-        return True
+        return self.needed(other) is not None
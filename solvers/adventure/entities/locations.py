@@ -0,0 +1,70 @@
+from collections import defaultdict
+
+
+class ItemLocations:
+    """
+    Where items of room piles are, by item name: name -> [...(position, depth,
+    item)], depth being the index of the item in the pile of the room at
+    <position> when it was indexed. Rooms of GameState <initial> are indexed
+    at once, or add_room() indexes them one at a time while exploring.
+
+    Piles only lose items from the top, so entries stay valid for all states
+    reached from the indexed ones: an item is still there as long as fewer
+    items than its depth were taken from its pile, which lookups check. Items
+    of the inventory, at most MAX_SIZE of them, are read from states.
+    """
+
+    def __init__(self, initial=None):
+        self.sizes = {}
+        self.entries = defaultdict(list)
+        if initial is not None:
+            for pos, room in initial.rooms:
+                self.add_room(pos, room)
+
+    def add_room(self, pos, room):
+        """
+        Index the pile of <room> at <pos>, replacing the one seen before
+        """
+        if pos in self.sizes:
+            for name, entries in self.entries.items():
+                entries[:] = [e for e in entries if e[0] != pos]
+
+        self.sizes[pos] = len(room.pile.items)
+        for depth, item in enumerate(room.pile.items):
+            self.entries[item.name].append((pos, depth, item))
+
+    def locate(self, state, item):
+        """
+        Yield (position, depth, item) for items of <state> with the name of
+        <item>, position being None and depth the index in the inventory for
+        inventory items, and depth the index in the current pile for others
+        """
+        for depth, i in enumerate(state.inv.items):
+            if i.name == item.name:
+                yield None, depth, i
+
+        entries = self.entries.get(item.name)
+        if not entries:
+            return
+
+        rooms = dict(state.rooms)
+        for pos, depth, i in entries:
+            taken = self.sizes[pos] - len(rooms[pos].pile.items)
+            if depth >= taken:
+                yield pos, depth - taken, i
+
+    def where(self, state, item):
+        """
+        (position, depth) of <item> itself in <state> as locate() gives them, or
+        None if it is not there anymore
+        """
+        for pos, depth, i in self.locate(state, item):
+            if i is item:
+                return pos, depth
+        return None
+
+    def find(self, state, item):
+        """
+        Items of <state> that can become <item>
+        """
+        return [i for _, _, i in self.locate(state, item) if i.can_become(item)]
@@ -0,0 +1,332 @@
+"""
+Pattern databases for repair searches
+
+A pattern is the tree of item names one or more requirements are built from:
+requirement names, and the names of the items missing from them, recursively.
+The search space is projected on each pattern by forgetting items outside of
+it: room piles only hold pattern items, and the inventory only holds pattern
+items with no limit on other ones. Exact costs to the goal are computed for all
+projected states reachable from the start, with a backward Dijkstra search.
+
+Each command is charged to the pattern of the item it takes, incinerates or
+repairs, and moves to the first pattern only, so costs of distinct patterns
+add up to a lower bound on the commands left.
+"""
+
+from collections import defaultdict
+import hashlib
+import heapq
+from itertools import permutations
+import math
+import os
+import pickle
+
+from ..errors import InvalidState
+from .inventory import MAX_SIZE
+
+
+# Tables are cached outside of solutions/, which is tracked
+DIR = ".cache/pdb"
+
+# Tables over this many projected states are given up, their pattern then
+# counts for nothing
+MAX_STATES = 1 << 20
+
+
+def component_names(item):
+    """
+    Names of <item> and of items missing from it, recursively
+    """
+    names = {item.name}
+    condition = item.condition
+    while condition is not None and condition.broken:
+        for missing in condition.missing:
+            names |= component_names(missing)
+        condition = condition.repaired
+    return names
+
+
+def pattern_names(items, requirement):
+    """
+    Names of <requirement> and of items missing from <items> of those names,
+    recursively
+    """
+    names = set()
+    frontier = [requirement.name]
+    while frontier:
+        name = frontier.pop()
+        if name in names:
+            continue
+        names.add(name)
+        for item in items:
+            if item.name == name:
+                frontier.extend(component_names(item))
+    return frozenset(names)
+
+
+class Pattern:
+    """
+    Projection of a RepairSpace on items named <names>, and the exact cost to
+    fulfill <requirements> from each projected state. Projected states are
+    (room, depths, inventory) tuples, the room being always 0 when moves are
+    not tracked.
+    """
+
+    def __init__(self, space, names, requirements, moves):
+        self.names = names
+        self.requirements = requirements
+        self.moves = moves
+
+        # Pattern items are numbered in the order they are met
+        self.items = []
+        self.item_ids = {}
+        self.combined = {}
+
+        self.piles = [
+            tuple(self.item_id(space.items[i]) for i in pile if self.member(space, i))
+            for pile in space.piles
+        ]
+        self.trash = {
+            self.item_id(space.items[i]) for i in space.trash if self.member(space, i)
+        }
+        self.room_moves = [[nxt for nxt, _ in m] for m in space.moves]
+
+        # Names of pattern items that other items can be repaired with
+        self.lost = {
+            name
+            for item in space.items
+            if item.name not in names
+            for name in component_names(item)
+        } & names
+        self.table = None
+
+    def member(self, space, i):
+        return space.items[i].name in self.names
+
+    def item_id(self, item):
+        try:
+            return self.item_ids[item]
+        except KeyError:
+            self.items.append(item)
+            return self.item_ids.setdefault(item, len(self.items) - 1)
+
+    def combine(self, broken, component):
+        try:
+            return self.combined[broken, component]
+        except KeyError:
+            pass
+
+        try:
+            result = self.item_id(
+                self.items[broken].combined_with(self.items[component])
+            )
+        except InvalidState:
+            result = None
+        return self.combined.setdefault((broken, component), result)
+
+    def project(self, space, state):
+        """
+        Projected state of RepairSpace <state>, before the table is built
+        """
+        _, room, depths, inv, _, _ = state
+        return (
+            room if self.moves else 0,
+            tuple(
+                sum(1 for i in pile[:d] if self.member(space, i))
+                for pile, d in zip(space.piles, depths)
+            ),
+            tuple(
+                sorted(
+                    self.item_id(space.items[i])
+                    for i in inv
+                    if self.member(space, i)
+                )
+            ),
+        )
+
+    def is_goal(self, state):
+        items = [self.items[i] for i in state[2]]
+        return all(any(i.matches(r) for i in items) for r in self.requirements)
+
+    def successors(self, state):
+        """
+        Yield (next state, cost charged to the pattern)
+        """
+        room, depths, inv = state
+
+        for p in (room,) if self.moves else range(len(self.piles)):
+            if depths[p] == len(self.piles[p]):
+                continue
+            item = self.piles[p][depths[p]]
+            nxt_depths = depths[:p] + (depths[p] + 1,) + depths[p + 1 :]
+            if item in self.trash:
+                yield (room, nxt_depths, inv), 2
+            elif len(inv) < MAX_SIZE:
+                yield (room, nxt_depths, tuple(sorted(inv + (item,)))), 1
+
+        for item in inv:
+            if item in self.trash or self.items[item].name in self.lost:
+                cost = 1 if item in self.trash else 0
+                yield (room, depths, tuple(i for i in inv if i != item)), cost
+
+        for broken, component in permutations(inv, 2):
+            repaired = self.combine(broken, component)
+            if repaired is not None:
+                kept = [i for i in inv if i not in (broken, component)]
+                yield (room, depths, tuple(sorted(kept + [repaired]))), 1
+
+        if self.moves:
+            for nxt in self.room_moves[room]:
+                yield (nxt, depths, inv), 1
+
+    def build(self, start):
+        """
+        Compute costs of all projected states reachable from <start>, return
+        False if there are too many of them
+        """
+        # state -> [...(previous state, cost)]
+        parents = defaultdict(list)
+        goals = []
+        seen = {start}
+        frontier = [start]
+        while frontier:
+            state = frontier.pop()
+            if self.is_goal(state):
+                goals.append(state)
+            for nxt, cost in self.successors(state):
+                parents[nxt].append((state, cost))
+                if nxt not in seen:
+                    if len(seen) >= MAX_STATES:
+                        return False
+                    seen.add(nxt)
+                    frontier.append(nxt)
+
+        self.table = dict.fromkeys(seen, math.inf)
+        heap = [(0, n, g) for n, g in enumerate(goals)]
+        counter = len(heap)
+        while heap:
+            cost, _, state = heapq.heappop(heap)
+            if cost >= self.table[state]:
+                continue
+            self.table[state] = cost
+            for prev, step in parents[state]:
+                if cost + step < self.table[prev]:
+                    counter += 1
+                    heapq.heappush(heap, (cost + step, counter, prev))
+        return True
+
+
+class PatternDatabase:
+    """
+    Pattern costs for the repair of <requirements> in RepairSpace <space>, one
+    pattern per group of requirements sharing item names. Tables are saved in
+    <directory>, keyed by a digest of the map snapshot, and loaded back when
+    solving the same snapshot again. They are pickled, so the directory must
+    only be writable by the user.
+    """
+
+    def __init__(self, space, requirements, directory=DIR):
+        self.space = space
+        requirements = list(set(requirements))
+        items = {*space.items}
+
+        groups = []
+        for r in requirements:
+            names = pattern_names(items, r)
+            merged = [g for g in groups if g[0] & names]
+            for g in merged:
+                groups.remove(g)
+                names |= g[0]
+            groups.append(
+                (names, [r, *(req for g in merged for req in g[1])])
+            )
+
+        # Moves are charged to the largest pattern
+        groups.sort(key=lambda g: -len(g[0]))
+        self.path = os.path.join(
+            directory, f"{self.digest(requirements)}.pickle"
+        )
+        self.patterns = self.load()
+        if self.patterns is None:
+            self.patterns = []
+            for n, (names, reqs) in enumerate(groups):
+                pattern = Pattern(space, names, reqs, moves=n == 0)
+                if pattern.build(pattern.project(space, space.start)):
+                    self.patterns.append(pattern)
+            self.save()
+
+    def digest(self, requirements):
+        snapshot = repr(
+            (
+                [self.space.items[i] for i in self.space.start[3]],
+                [[self.space.items[i] for i in pile] for pile in self.space.piles],
+                self.space.positions,
+                self.space.moves,
+                self.space.start[1],
+                sorted(map(repr, (self.space.items[i] for i in self.space.trash))),
+                sorted(map(repr, requirements)),
+            )
+        )
+        return hashlib.sha1(snapshot.encode()).hexdigest()[:16]
+
+    def load(self):
+        try:
+            with open(self.path, mode="rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", mode=0o700, exist_ok=True)
+        with open(self.path, mode="wb") as f:
+            pickle.dump(self.patterns, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def heuristic(self):
+        """
+        h(state): sum of pattern costs of RepairSpace state
+        """
+        space = self.space
+
+        # Per pattern: space item id -> pattern item id or None, and per room
+        # number of pattern items in the first k pile items
+        members = [{} for _ in self.patterns]
+        counts = []
+        for pattern in self.patterns:
+            counts.append(
+                [
+                    [
+                        sum(1 for i in pile[:k] if pattern.member(space, i))
+                        for k in range(len(pile) + 1)
+                    ]
+                    for pile in space.piles
+                ]
+            )
+
+        def member(n, i):
+            try:
+                return members[n][i]
+            except KeyError:
+                item = space.items[i]
+                pattern = self.patterns[n]
+                found = None
+                if item.name in pattern.names:
+                    found = pattern.item_ids.get(item)
+                return members[n].setdefault(i, found)
+
+        def h(state):
+            _, room, depths, inv, _, _ = state
+            total = 0
+            for n, pattern in enumerate(self.patterns):
+                projected = (
+                    room if pattern.moves else 0,
+                    tuple(c[d] for c, d in zip(counts[n], depths)),
+                    tuple(
+                        sorted(
+                            m for i in inv if (m := member(n, i)) is not None
+                        )
+                    ),
+                )
+                total += pattern.table.get(projected, 0)
+            return total
+
+        return h
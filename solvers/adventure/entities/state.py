@@ -10,10 +10,6 @@ class GameState(
 ):
     __slots__ = ()
 
-    def __lt__(self, other):
-        # Dummy comparison to avoid the astar heapq deep-comparing states
-        return False
-
     @property
     def room(self):
         return next(r for p, r in self.rooms if p == self.pos)
@@ -22,42 +18,162 @@ class GameState(
     def all_items(self):
         return self.inv.all_items + [i for _, r in self.rooms for i in r.all_items]
 
-    def find(self, item):
+    @staticmethod
+    def tail(commands):
+        """
+        Last commands next_states() depends on: the last moves if the last
+        command was a move, or the last command otherwise
+        """
+        moves = 0
+        while moves < len(commands) and commands[-1 - moves] in RDIRS:
+            moves += 1
+        return commands[-moves:] if moves else commands[-1:]
+
+    def trimmed(self):
+        """
+        Same state, only keeping the commands next_states() depends on
+        """
+        return self._replace(commands=self.tail(self.commands))
+
+    def context(self):
+        """
+        What next_states() depends on besides the world: whether we just
+        started, rooms we just came from, or the item we just took or repaired
+        """
+        if not self.commands:
+            return None
+
+        last = self.commands[-1]
+        if last in RDIRS:
+            return frozenset(self.previous_positions())
+        if last.startswith("take "):
+            return last[len("take ") :]
+        if last.startswith("combine "):
+            return last[len("combine ") : last.index(" with ")]
+        return ""
+
+    def canonical(self):
+        """
+        Key equal for states with the same next states whatever commands led to
+        them, up to inventory order
+        """
+        return (
+            self.pos,
+            tuple(sorted(self.inv.items, key=id)),
+            tuple(sorted(self.rooms)),
+            self.context(),
+        )
+
+    def previous_positions(self):
+        just_moved = takewhile(lambda c: c in RDIRS, reversed(self.commands))
+        prev_positions = set()
+        cur = self.pos
+        for m in just_moved:
+            cx, cy = cur
+            dx, dy = RDIRS[INVERSE_DIRS[m]]
+            cur = cx + dx, cy + dy
+            prev_positions.add(cur)
+        return prev_positions
+
+    def move_origin(self):
+        """
+        Position the last moves started from, the current one if the last
+        command was not a move
+        """
+        cur = self.pos
+        for m in takewhile(lambda c: c in RDIRS, reversed(self.commands)):
+            cx, cy = cur
+            dx, dy = RDIRS[INVERSE_DIRS[m]]
+            cur = cx + dx, cy + dy
+        return cur
+
+    def find(self, item, locations=None):
+        """
+        Items that can become <item>, looked up in ItemLocations <locations>
+        indexing this state or a state it was reached from, if given
+        """
+        if locations is not None:
+            return locations.find(self, item)
+
         return [
             i
             for where in (self.inv, *[r for _, r in self.rooms])
             for i in where.find(item)
         ]
 
-    def next_states(self, trash=[]):
+    def after(self, commands):
+        """
+        State reached by running <commands> from this one, raising InvalidState
+        when one of them cannot be run
+        """
+        state = self
+        for cmd in commands:
+            state = state.after_command(cmd)
+        return state
+
+    def after_command(self, cmd):
+        """
+        State reached by running a single command, see after()
+        """
+
+        def held(name):
+            try:
+                return next(i for i in self.inv.items if i.full_name == name)
+            except StopIteration:
+                raise InvalidState(f"Inventory has no {name}")
+
+        pos, inv, rooms = self.pos, self.inv, self.rooms
+        if cmd in RDIRS:
+            explorer = MapExplorer.locate(self.room.name)
+            targets = [
+                p for p in explorer.neighbours(pos) if explorer.go(pos, p) == [cmd]
+            ]
+            if not targets:
+                raise InvalidState(f"Cannot go {cmd} from {self.room.name}")
+            [pos] = targets
+        elif cmd.startswith("take "):
+            taken, new_room = self.room.without_first_item()
+            if taken.full_name != cmd[len("take ") :]:
+                raise InvalidState(f"Top item is {taken.full_name}, cannot {cmd}")
+            inv = inv.with_item(taken)
+            rooms = ((pos, new_room),) + tuple((p, r) for p, r in rooms if p != pos)
+        elif cmd.startswith("incinerate "):
+            inv = inv.without_item(held(cmd[len("incinerate ") :]))
+        elif cmd.startswith("combine "):
+            broken, component = cmd[len("combine ") :].split(" with ")
+            inv = inv.with_combined(held(broken), held(component))
+        else:
+            raise InvalidState(f"Unknown command {cmd}")
+
+        return GameState(pos, inv, rooms, (*self.commands, cmd))
+
+    def next_states(self, trash=[], reduce=True):
         """
         Generate next possible states, allowing any item in <trash> to be incinerated
+
+        Moves in a row only change the room, so with <reduce> only one way to
+        go from a room to another is kept: the shortest path given by
+        NavIndex.parent() from the room the moves started from. Optimal
+        solutions are kept, orderings of the same moves and detours are not.
         """
         # Start by destroying all trash items in the inventory
         if not self.commands:
             try:
                 trashed, inv = self.inv.without_trash(trash)
-                trash_cmds = [
-                    f"{cmd} {item.full_name}"
-                    for item in trashed
-                    for cmd in ("take", "incinerate")
-                ]
+                trash_cmds = [f"incinerate {item.full_name}" for item in trashed]
                 yield GameState(
                     self.pos,
                     inv,
-                    self.rooms(*self.commands, *trash_cmds),
+                    self.rooms,
+                    (*self.commands, *trash_cmds),
                 )
             except InvalidState:
                 pass
 
-        just_moved = list(takewhile(lambda c: c in RDIRS, reversed(self.commands)))
-        prev_positions = set()
-        cur = self.pos
-        for m in just_moved:
-            cx, cy = cur
-            dx, dy = RDIRS[INVERSE_DIRS[m]]
-            cur = cx + dx, cy + dy
-            prev_positions.add(cur)
+        just_moved = self.commands and self.commands[-1] in RDIRS
+        prev_positions = (
+            self.previous_positions() if just_moved and not reduce else ()
+        )
 
         # Destroy all trash items on top of current room pile
         if self.inv.free_slots:
@@ -129,9 +245,14 @@ class GameState(
 
         # Move to another room
         explorer = MapExplorer.locate(self.room.name)
+        origin = self.move_origin() if reduce else None
         for pos in explorer.neighbours():
+            if reduce:
+                if explorer.nav.parent(origin, pos) != self.pos:
+                    continue
+
             # Do not move back to a room we just visited
-            if pos in prev_positions:
+            elif pos in prev_positions:
                 continue
 
             (cmd,) = explorer.go(self.pos, pos)
@@ -1,4 +1,4 @@
-from ..lib import astar, ASTAR_GOAL
+from ..lib import plan_route
 
 
 DIRS = {(-1, 0): "west", (1, 0): "east", (0, 1): "south", (0, -1): "north"}
@@ -6,99 +6,155 @@ RDIRS = {v: k for k, v in DIRS.items()}
 INVERSE_DIRS = {"north": "south", "south": "north", "east": "west", "west": "east"}
 
 
+class NavIndex:
+    """
+    Navigation tables of a map, built once from its edges: adjacency lists,
+    all-pairs distances and next hops on shortest paths, computed with a BFS
+    from each room.
+    """
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.rooms = sorted({r for e in edges for r in e})
+        self.index = {p: i for i, p in enumerate(self.rooms)}
+
+        self.adjacent = {
+            p: tuple({(e - {p}).pop() for e in edges if p in e}) for p in self.rooms
+        }
+        adjacent = [[self.index[n] for n in self.adjacent[p]] for p in self.rooms]
+
+        size = len(self.rooms)
+        self.dist = []
+        for src in range(size):
+            dist = [None] * size
+            dist[src] = 0
+            frontier = [src]
+            while frontier:
+                nxt_frontier = []
+                for cur in frontier:
+                    for n in adjacent[cur]:
+                        if dist[n] is None:
+                            dist[n] = dist[cur] + 1
+                            nxt_frontier.append(n)
+                frontier = nxt_frontier
+            self.dist.append(dist)
+
+        # First neighbour of a room that is one step closer to the target
+        self.next_hop = [
+            [
+                (
+                    src
+                    if src == dst
+                    else next(
+                        (
+                            n
+                            for n in adjacent[src]
+                            if self.dist[n][dst] is not None
+                            and self.dist[n][dst] == self.dist[src][dst] - 1
+                        ),
+                        None,
+                    )
+                )
+                for dst in range(size)
+            ]
+            for src in range(size)
+        ]
+
+    def distance(self, a, b):
+        return self.dist[self.index[a]][self.index[b]]
+
+    def parent(self, root, room):
+        """
+        Room before <room> on the shortest path from <root> to it, following
+        next hops towards <root>. These paths form a tree rooted at <root>, so
+        the path to a room starts with the paths to the rooms on it.
+        """
+        cur, dst = self.index[room], self.index[root]
+        if cur == dst or self.dist[cur][dst] is None:
+            return None
+        return self.rooms[self.next_hop[cur][dst]]
+
+    def path(self, a, b):
+        """
+        Rooms on a shortest path from <a> to <b>, excluding <a>
+        """
+        cur, dst = self.index[a], self.index[b]
+        if self.dist[cur][dst] is None:
+            raise Exception(f"No path from {a} to {b}")
+
+        path = []
+        while cur != dst:
+            cur = self.next_hop[cur][dst]
+            path.append(self.rooms[cur])
+        return path
+
+
 class MapExplorer:
     @staticmethod
     def locate(room_name):
+        try:
+            return MapExplorer.located[room_name]
+        except KeyError:
+            pass
+
+        explorer = None
         if ChicagoExplorer.match(room_name):
-            return ChicagoExplorer(room_name)
+            explorer = ChicagoExplorer(room_name)
+        elif EntranceExplorer.match(room_name):
+            explorer = EntranceExplorer(room_name)
+
+        return MapExplorer.located.setdefault(room_name, explorer)
 
-        if EntranceExplorer.match(room_name):
-            return EntranceExplorer(room_name)
+    # Explorers are immutable, share them by room name
+    located = {}
+
+    @classmethod
+    def navigation(cls):
+        if "nav" not in cls.__dict__:
+            cls.nav = NavIndex(cls.map_edges())
+        return cls.nav
 
     def __init__(self, room_name):
         self.pos = self.room_position(room_name)
-        self.edges = self.edges()
+        self.nav = self.navigation()
+        self.edges = self.nav.edges
 
     def room_position(self, room_name):
         raise NotImplementedError()
 
-    def edges(self):
+    @classmethod
+    def map_edges(cls):
         raise NotImplementedError()
 
     def dist(self, a, b):
-        return sum(abs(a[i] - b[i]) for i in range(2))
+        return self.nav.distance(a, b)
 
     def neighbours(self, pos=None):
-        if not pos:
-            pos = self.pos
-
-        return {(e - {pos}).pop() for e in self.edges if pos in e}
+        return self.nav.adjacent[pos or self.pos]
 
     def go(self, start, target, as_positions=False):
-        if self.dist(start, target) == 1:
-            if as_positions:
-                return [target]
-            sx, sy = start
-            tx, ty = target
-            return [DIRS[(tx - sx, ty - sy)]]
-
-        path, _ = astar(
-            start,
-            lambda p: p == target,
-            lambda p: self.neighbours(p),
-            lambda a, b: 1,
-            lambda p: self.dist(p, target),
-        )
-
-        cur, *path = path
-
+        path = self.nav.path(start, target)
         if as_positions:
-            return path[1:]
+            return path
 
         cmds = []
+        cur = start
         for p in path:
             cx, cy = cur
             px, py = p
-            dx, dy = px - cx, py - cy
-            cmds.append(DIRS[(dx, dy)])
+            cmds.append(DIRS[(px - cx, py - cy)])
             cur = p
 
         return cmds
 
     def explore(self):
-        # List all rooms
-        rooms = set(r for e in self.edges for r in e)
-
-        def next_paths(p):
-            cur = p[-1]
-            for unvisited in rooms - set(p):
-                yield (*p, *self.go(cur, unvisited, as_positions=True))
-
-        def path_dist(a, b):
-            # b starts with a
-            cur, *path = b[len(a) - 1 :]
-            dist = 0
-            while path:
-                nxt, *path = path
-                dist += self.dist(cur, nxt)
-                cur = nxt
-            return dist
-
-        # Find shortest path in paths space to visit all rooms
-        [path] = astar(
-            (self.pos,),
-            lambda p: set(p) == rooms,
-            lambda p: next_paths(p),
-            lambda a, b: path_dist(a, b),
-            lambda p: len(rooms - set(p)),
-            ret=ASTAR_GOAL,
-        )
+        """
+        Yield (room, commands to go there) along a short route visiting all rooms
+        """
+        route = plan_route(self.pos, self.nav.rooms, self.dist)
 
-        cur, *path = path
-        while path:
-            nxt, *path = path
+        for cur, nxt in zip(route, route[1:]):
             yield nxt, self.go(cur, nxt)
-            cur = nxt
 
 
 class EntranceExplorer(MapExplorer):
@@ -110,7 +166,8 @@ class EntranceExplorer(MapExplorer):
         else:
             return (0, 1)
 
-    def edges(self):
+    @classmethod
+    def map_edges(cls):
         return [{(0, 0), (0, 1)}]
 
 
@@ -128,14 +185,15 @@ class ChicagoExplorer(MapExplorer):
             next(i for i, y in enumerate(self.STREETS_Y) if ns.startswith(y)),
         )
 
-    def edges(self):
+    @classmethod
+    def map_edges(cls):
         return [
             {(x, y), (x + dx, y + dy)}
-            for x in range(len(self.STREETS_X))
-            for y in range(len(self.STREETS_Y))
-            if (x, y) not in self.EXCLUDE
+            for x in range(len(cls.STREETS_X))
+            for y in range(len(cls.STREETS_Y))
+            if (x, y) not in cls.EXCLUDE
             for dx, dy in ((0, 1), (1, 0))
-            if 0 <= x + dx < len(self.STREETS_X)
-            and 0 <= y + dy < len(self.STREETS_Y)
-            and (x + dx, y + dy) not in self.EXCLUDE
+            if 0 <= x + dx < len(cls.STREETS_X)
+            and 0 <= y + dy < len(cls.STREETS_Y)
+            and (x + dx, y + dy) not in cls.EXCLUDE
         ]
@@ -11,105 +11,70 @@ import re
 
 
 RE_SYMBOL = r"[a-z_]+"
-RE_STRING = r"\"((?:\\.|[^\\\"])+)\""
+RE_STRING = r"\"(?P<str>(?:\\.|[^\\\"])+)\""
 RE_PUB = r"[A-Z]{5}\.[A-Z]{3}=\d+@\d+\|[0-9a-f]{20,}"
 
+# Token kinds
+SYMBOL, STRING, LPAREN, RPAREN, CONS, NIL = range(6)
 
-class Token:
-    __match_args__ = ("content",)
+KIND_NAMES = ["symbol", "string", "'('", "')'", "'::'", "'nil'"]
 
-    def __init__(self, content, i):
-        self.content = content
-        self.i = i
+# Single pass tokenizer: alternatives are tried in this order at each position,
+# the last one catches unexpected chars.
+RE_TOKEN = re.compile(
+    r"(?P<nl>\n)"
+    rf"|(?P<pub>{RE_PUB})"
+    rf"|(?P<sym>{RE_SYMBOL})"
+    rf"|{RE_STRING}"
+    r"|(?P<sp> +)"
+    r"|(?P<lp>\()"
+    r"|(?P<rp>\))"
+    r"|(?P<cons>::)"
+    r"|(?P<err>.)",
+    re.S,
+)
+RE_PUB_SEARCH = re.compile(RE_PUB)
 
-    def __repr__(self):
-        name = type(self).__name__
-        if name == "Reserved":
-            return f"<{self.content} at {self.i}>"
-        if self.content:
-            return f"<{name} {self.content} at {self.i}>"
-        else:
-            return f"<{name} at {self.i}>"
 
-    def __eq__(self, other):
-        return type(self) == type(other) and self.content == other.content
-
-
-class Symbol(Token):
-    pass
-
-
-class String(Token):
-    pass
-
-
-class Reserved(Token):
-    pass
-
-
-def LParen(i=-1):
-    return Reserved("(", i)
-
-
-def RParen(i=-1):
-    return Reserved(")", i)
-
-
-def Cons(i=-1):
-    return Reserved("::", i)
-
-
-def Nil(i=-1):
-    return Reserved("nil", i)
+def describe(token):
+    kind, value, i = token
+    if kind in (SYMBOL, STRING):
+        return f"<{KIND_NAMES[kind]} {value} at {i}>"
+    return f"<{KIND_NAMES[kind]} at {i}>"
 
 
 def tokenize(s):
-    """Tokenize s into a list of token streams and a list of publications"""
+    """
+    Tokenize s into a list of token streams and a list of publications.
+    Tokens are (kind, value, index) tuples.
+    """
     streams = []
     tokens = []
     pubs = []
-    i = 0
-    while i < len(s):
-        if s[i] == "\n":
+
+    for m in RE_TOKEN.finditer(s):
+        group = m.lastgroup
+
+        if group == "sym":
+            val = m.group(group)
+            tokens.append((NIL if val == "nil" else SYMBOL, val, m.start()))
+        elif group == "lp":
+            tokens.append((LPAREN, "(", m.start()))
+        elif group == "rp":
+            tokens.append((RPAREN, ")", m.start()))
+        elif group == "str":
+            string = m.group(group).replace('\\"', '"')
+            tokens.append((STRING, string, m.start()))
+            pubs.extend(RE_PUB_SEARCH.findall(string))
+        elif group == "nl":
             streams.append(tokens)
             tokens = []
-            i += 1
-            continue
-
-        m = re.match(RE_PUB, s[i:])
-        if m:
+        elif group == "cons":
+            tokens.append((CONS, "::", m.start()))
+        elif group == "pub":
             pubs.append(m.group())
-            i += m.end()
-            continue
-
-        m = re.match(RE_SYMBOL, s[i:])
-        if m:
-            val = m.group()
-            tokens.append(Nil(i) if val == "nil" else Symbol(val, i))
-            i += m.end()
-            continue
-
-        m = re.match(RE_STRING, s[i:], re.S)
-        if m:
-            string = m.groups()[0].replace('\\"', '"')
-            tokens.append(String(string, i))
-            pubs.extend(re.findall(RE_PUB, string))
-            i += m.end()
-            continue
-
-        if s[i] == " ":
-            i += 1
-        elif s[i] == "(":
-            tokens.append(LParen(i))
-            i += 1
-        elif s[i] == ")":
-            tokens.append(RParen(i))
-            i += 1
-        elif s[i : i + 2] == "::":
-            tokens.append(Cons(i))
-            i += 2
-        else:
-            assert False, f"Unexpected char '{s[i]}' at index {i}"
+        elif group == "err":
+            raise ValueError(f"Unexpected char '{m.group()}' at index {m.start()}")
 
     if tokens:
         streams.append(tokens)
@@ -117,78 +82,199 @@ def tokenize(s):
     return streams, pubs
 
 
-def parse_list(t, i):
+def parse_list(t, i, build=None):
     """
     Parse rule:
         list: NIL | "(" expr ")" "::" list
     """
     items = []
-    while t[i] == Nil() or (t[i] == LParen() and t[i + 1] == LParen()):
-        if t[i] == Nil():
+    while True:
+        kind = t[i][0]
+        if kind == NIL:
             return items, i + 1
-        item, i = parse_expr(t, i + 1)
+
+        if kind != LPAREN or t[i + 1][0] != LPAREN:
+            raise ValueError(
+                f"Expected 'nil' or list item, got {describe(t[i])} instead"
+            )
+
+        item, i = parse_expr(t, i + 1, build)
         items.append(item)
-        assert t[i] == RParen(), f"Expected ')', got {t[i]} instead"
-        assert t[i + 1] == Cons(), f"Expected '::', got {t[i+1]} instead"
+        if t[i][0] != RPAREN:
+            raise ValueError(f"Expected ')', got {describe(t[i])} instead")
+        if t[i + 1][0] != CONS:
+            raise ValueError(f"Expected '::', got {describe(t[i+1])} instead")
         i += 2
 
 
-def parse_args(t, i):
+def parse_args(t, i, build=None):
     """
     Parse rule:
         args: SYMBOL | STRING | list | expr+
     """
-    match t[i:]:
-        case [Symbol() as s, *_]:
-            return s.content, i + 1
-        case [String() as s, *_]:
-            return s.content, i + 1
-        case [Reserved("nil"), *_]:
-            return [], i + 1
-        case [Reserved("("), Reserved("("), *_]:
-            return parse_list(t, i)
-        case [Reserved("("), *_]:
-            exprs = []
-            while t[i] == LParen():
-                expr, i = parse_expr(t, i)
-                exprs.append(expr)
-            return exprs, i
-    assert False, f"Expected symbol, string, 'nil', list or expr, got {t[i]} instead"
-
-
-def parse_expr(t, i):
+    kind = t[i][0]
+
+    if kind == SYMBOL or kind == STRING:
+        return t[i][1], i + 1
+    if kind == NIL:
+        return [], i + 1
+    if kind == LPAREN:
+        if t[i + 1][0] == LPAREN:
+            return parse_list(t, i, build)
+
+        exprs = []
+        while t[i][0] == LPAREN:
+            expr, i = parse_expr(t, i, build)
+            exprs.append(expr)
+        return exprs, i
+
+    raise ValueError(
+        f"Expected symbol, string, 'nil', list or expr, got {describe(t[i])} instead"
+    )
+
+
+def parse_expr(t, i, build=None):
     """
     Parse rule:
         expr: "(" SYMBOL args ")"
+
+    Expressions are returned as (symbol, args) tuples, or as the result of
+    build(symbol, args) when specified, which is called bottom-up.
     """
-    match t[i:]:
-        case [Reserved("("), Symbol() as s, *_]:
-            args, i = parse_args(t, i + 2)
-            assert t[i] == RParen(), f"Expected ')', got {t[i]} instead"
-            return (s.content, args), i + 1
+    if i + 1 < len(t) and t[i][0] == LPAREN and t[i + 1][0] == SYMBOL:
+        symbol = t[i + 1][1]
+        args, i = parse_args(t, i + 2, build)
+        if t[i][0] != RPAREN:
+            raise ValueError(f"Expected ')', got {describe(t[i])} instead")
+        if build:
+            return build(symbol, args), i + 1
+        return (symbol, args), i + 1
+
+    if i + 1 < len(t) and t[i][0] == LPAREN:
+        raise ValueError(f"Expected symbol, got {describe(t[i + 1])} instead")
 
-    what = t[i] if i < len(t) else f"end of stream after {t[i-1]}"
-    assert False, f"Expected '(', got {what} instead"
+    what = describe(t[i]) if i < len(t) else f"end of stream after {describe(t[i-1])}"
+    raise ValueError(f"Expected '(', got {what} instead")
 
 
-def parse_ml(s, last_stream_only=True):
+def parse_tokens(tokens, build=None):
+    """
+    Parse a stream of tokens holding a single expression, see parse_expr().
+    Raises ValueError when they do not.
+    """
+    if not tokens:
+        raise ValueError("Empty token stream")
+
+    try:
+        root, i = parse_expr(tokens, 0, build)
+    except IndexError:
+        raise ValueError(f"Unexpected end of stream after {describe(tokens[-1])}")
+
+    if i != len(tokens):
+        raise ValueError(f"Unparsed tokens remain: {tokens[i:]}")
+    return root
+
+
+def parse_ml(s, last_stream_only=True, build=None):
     """
     Parse a stream of output that may contain several expressions
     on different lines, as well as raw publications on their own line.
 
     Returns a list of top nodes (one for each expression) and a list
-    of publications.
+    of publications. Raises ValueError on invalid input.
     """
 
     streams, pubs = tokenize(s)
     parsed = []
 
     if last_stream_only:
-        streams = [streams[-1]]
+        streams = [streams[-1] if streams else []]
 
     for tokens in streams:
-        root, i = parse_expr(tokens, 0)
-        assert i == len(tokens), f"Unparsed tokens remain: {tokens[i:]}"
-        parsed.append(root)
+        parsed.append(parse_tokens(tokens, build))
 
     return parsed[0] if last_stream_only else parsed, pubs
+
+
+class MLStream:
+    """
+    Push-based parser for ML output: feed it chars as they are output, and it
+    calls on_expr(expr) as soon as a top-level expression is closed, and
+    on_pub(pub) for each publication, whether raw or inside strings. Expressions
+    are built with <build> when specified, see parse_expr().
+
+    Text outside of expressions is ignored (except for publications), as are
+    expressions that fail to parse, which are counted in .errors instead.
+    Only the chars of the current expression are buffered, and each of them
+    is tokenized once, when the expression is closed.
+    """
+
+    def __init__(self, on_expr, on_pub, build=None):
+        self.on_expr = on_expr
+        self.on_pub = on_pub
+        self.build = build
+        self.errors = 0
+        self.reset()
+
+    def reset(self):
+        self.expr = []
+        self.text = []
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+
+    def feed(self, chars):
+        for ch in chars:
+            if not self.depth:
+                if ch == "(":
+                    self.depth = 1
+                    self.expr.append(ch)
+                elif ch == "\n":
+                    self.flush_text()
+                else:
+                    self.text.append(ch)
+                continue
+
+            self.expr.append(ch)
+
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif ch == "\\":
+                    self.escaped = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "(":
+                self.depth += 1
+            elif ch == ")":
+                self.depth -= 1
+                if not self.depth:
+                    self.close_expr()
+            elif ch == "\n":
+                # Expressions never span several lines
+                self.errors += 1
+                self.reset()
+
+    def flush_text(self):
+        if self.text:
+            for pub in RE_PUB_SEARCH.findall("".join(self.text)):
+                self.on_pub(pub)
+            self.text = []
+
+    def close_expr(self):
+        s = "".join(self.expr)
+        self.expr = []
+
+        try:
+            streams, pubs = tokenize(s)
+            [tokens] = streams
+            expr = parse_tokens(tokens, self.build)
+        except ValueError:
+            self.errors += 1
+            return
+
+        for pub in pubs:
+            self.on_pub(pub)
+        self.on_expr(expr)
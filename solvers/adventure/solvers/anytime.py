@@ -0,0 +1,46 @@
+from ...lib import Budget, anytime
+from ..entities.compact import RepairSpace
+from .astarrepair import AstarRepairSolver
+
+
+class AnytimeRepairSolver(AstarRepairSolver):
+    """
+    Solve repair task with beam search then weighted A*, saving each improving
+    solution unless <checkpoint> is False, within a time and/or node budget
+    """
+
+    OUT_BASE = "solutions/adventure-anytime-"
+
+    def __init__(
+        self, printmsg, targets, seconds=None, nodes=None, width=100, checkpoint=True
+    ):
+        super().__init__(printmsg, targets)
+        self.checkpoint = checkpoint
+        self.seconds = seconds
+        self.nodes = nodes
+        self.width = width
+
+    def solve(self, initial, requirements):
+        # Compact states merge worlds reached by different command orders, and
+        # come with an admissible heuristic
+        space = RepairSpace(initial, self.trash(initial, requirements))
+
+        def on_solution(goal, cost, actions):
+            self.print(f"found a solution with {cost} commands")
+            if self.checkpoint:
+                self.save(space.commands(actions))
+
+        best = anytime(
+            space.start,
+            space.goal(requirements),
+            space.successors,
+            space.heuristic(requirements),
+            width=self.width,
+            budget=Budget(self.seconds, self.nodes),
+            on_solution=on_solution,
+        )
+
+        if best.goal is not None:
+            if best.optimal:
+                self.print(f"solution with {best.cost} commands is optimal")
+            return space.commands(best.actions)
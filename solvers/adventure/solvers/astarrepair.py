@@ -1,9 +1,15 @@
-from collections import defaultdict
-
-from ...lib import astar, ASTAR_GOAL
+from ...lib import DominanceIndex, ExternalSearch, ParallelSearch, Search
+from ..entities.codec import StateCodec
+from ..entities.compact import RepairSpace
+from ..entities.pdb import PatternDatabase
 from .repair import BaseRepairSolver
 
 
+# Heuristic options: none (uniform-cost search), the requirement-based lower
+# bound, or the bound along with pattern databases
+HEURISTICS = ("off", "bound", "pdb")
+
+
 class AstarRepairSolver(BaseRepairSolver):
     """
     Solve repair task with A* state space search
@@ -11,45 +17,96 @@ class AstarRepairSolver(BaseRepairSolver):
 
     OUT_BASE = "solutions/adventure-astar-"
 
-    def solve(self, initial, requirements):
-        # Build list of all items as generic item -> [(actual item, location)...]
-        available = defaultdict(lambda: [])
-        for item in initial.inv.all_items:
-            available[item.as_pristine_generic()].append((item, initial.inv, None))
+    def __init__(self, printmsg, targets, workers=1, memory=None, heuristic="bound"):
+        super().__init__(printmsg, targets)
+        if heuristic not in HEURISTICS:
+            raise ValueError(
+                f"Unknown heuristic {heuristic!r}, use one of {', '.join(HEURISTICS)}"
+            )
 
-        for pos, room in initial.rooms:
-            for item in room.all_items:
-                available[item.as_pristine_generic()].append((item, room, pos))
+        self.workers = workers
+        self.memory = memory
+        self.heuristic = heuristic
+
+    def trash(self, initial, requirements):
+        """
+        Return items of <initial> that are not needed to fulfill <requirements>
+        """
+        locations = self.item_locations(initial)
 
         # Build list of required items by recursing on requirements
         frontier = set(requirements)
         required = set()
         while frontier:
             item = frontier.pop()
-            generic = item.as_pristine_generic()
-            if generic not in available:
-                raise Exception(f"No match for {item}")
-
-            matching = []
-            for candidate, *_ in available[generic]:
-                if candidate.can_become(item):
-                    matching.append(candidate)
-
+            matching = locations.find(initial, item)
             if not matching:
                 raise Exception(f"No match for {item}")
 
             required.update(matching)
-            frontier.update(r for m in matching for r in m.needed_to_become(item))
-
-        trash = [i for i in initial.all_items if i not in required]
-        ret = astar(
-            initial,
-            lambda s: s.inv.matches(requirements),
-            lambda s: s.next_states(trash),
-            lambda a, b: len(b.commands) - len(a.commands),
-            lambda s: 0,
-            ret=ASTAR_GOAL,
+            frontier.update(r for m in matching for r in m.needed(item))
+
+        return [i for i in initial.all_items if i not in required]
+
+    def solve(self, initial, requirements):
+        trash = self.trash(initial, requirements)
+        hook = lambda stats: self.print(f"search: {stats}")
+
+        # Compact states are their own canonical key, solutions are rebuilt
+        # from the actions recorded on parent links
+        space = RepairSpace(initial, trash)
+        heuristic = lambda s: 0
+        if self.heuristic != "off":
+            heuristic = space.heuristic(requirements)
+        if self.heuristic == "pdb":
+            bound, pdb = heuristic, PatternDatabase(space, requirements).heuristic()
+            heuristic = lambda s: max(bound(s), pdb(s))
+
+        if self.memory:
+            codec = StateCodec(space)
+            search = ExternalSearch(
+                space.start,
+                space.goal(requirements),
+                space.successors,
+                codec.encode,
+                codec.decode,
+                heuristic,
+                memory=self.memory,
+                hook=hook,
+            )
+            try:
+                if search.run() is not None:
+                    return space.commands(search.actions())
+                return None
+            finally:
+                search.cleanup()
+
+        if self.workers > 1:
+            # Zobrist keys are the same in all workers once all items are
+            # interned, and spread states evenly
+            space.intern_all()
+            search = ParallelSearch(
+                space.start,
+                space.goal(requirements),
+                space.successors,
+                heuristic,
+                workers=self.workers,
+                partition=lambda s: s[0],
+                hook=hook,
+            )
+            if search.run() is not None:
+                return space.commands(search.actions())
+            return None
+
+        search = Search(
+            space.start,
+            space.goal(requirements),
+            space.successors,
+            heuristic,
+            hook=hook,
+            dominance=DominanceIndex(space.dominance_key, space.dominates),
         )
+        goal = search.run()
 
-        if ret:
-            return list(ret[0].commands)
+        if goal:
+            return space.commands(search.actions(goal))
@@ -1,27 +1,95 @@
+from ..entities.item import Item
+from .anytime import AnytimeRepairSolver
 from .astarrepair import AstarRepairSolver
+from .plan import PlanRepairSolver
+from .portfolio import PortfolioRepairSolver
+
+
+def parse_options(args):
+    """
+    Split leading '--name value' pairs from <args>, return (options, rest)
+    """
+    options = {}
+    while len(args) > 1 and args[0].startswith("--"):
+        options[args[0][2:]] = args[1]
+        args = args[2:]
+    return options, args
 
 
 class AdventureSolver:
     """
     solver for adventure puzzles, possible parameter values:
-    - 'astar ITEM [ITEM...]': find and repair ITEMs using A* in state space
+    - 'astar [--workers N] [--memory M] [--heuristic H] ITEM [ITEM...]': find
+      and repair ITEMs using A* in state space, on N processes, or keeping at
+      most M states in memory and the rest on disk; H is 'bound' (default),
+      'pdb' to add pattern databases, or 'off' to compare expanded node counts
+    - 'anytime [--seconds S] [--nodes N] [--width W] ITEM [ITEM...]': find and
+      repair ITEMs with beam search of width W then weighted A*, saving better
+      solutions as they are found until S seconds or N nodes are spent
+    - 'plan ITEM [ITEM...]': find and repair ITEMs choosing one item for each
+      missing component, then searching state space for one repair at a time;
+      fast, but solutions are not optimal
+    - 'portfolio [--strategies S,...] [--seconds S] [--keep first|best] ITEM
+      [ITEM...]': find and repair ITEMs with several solvers at once, one
+      process each ('astar', 'bound', 'pdb', 'anytime' and 'plan' by default),
+      keeping the first solution found, or the shortest one found in S seconds
     """
 
     def __init__(self, printmsg):
         self.solver = None
         self.print = printmsg
 
+    def feed(self, ch):
+        if self.solver:
+            self.solver.feed(ch)
+
     def handle_output(self, output):
         if not self.solver:
-            match output.split(" "):
-                case [""]:
-                    print("solver needs a parameter")
-                    return
-                case ["astar", *items]:
-                    self.solver = AstarRepairSolver(self.print, items)
-                case _:
-                    print(f"no solver for: {output}")
-                    return
+            # Solvers reject invalid option values
+            try:
+                match output.split(" "):
+                    case [""]:
+                        print("solver needs a parameter")
+                        return
+                    case ["astar", *args]:
+                        options, items = parse_options(args)
+                        self.solver = AstarRepairSolver(
+                            self.print,
+                            items,
+                            workers=int(options.get("workers", 1)),
+                            memory=(
+                                int(options["memory"]) if "memory" in options else None
+                            ),
+                            heuristic=options.get("heuristic", "bound"),
+                        )
+                    case ["anytime", *args]:
+                        options, items = parse_options(args)
+                        self.solver = AnytimeRepairSolver(
+                            self.print,
+                            items,
+                            seconds=float(options.get("seconds", 60)),
+                            nodes=int(options["nodes"]) if "nodes" in options else None,
+                            width=int(options.get("width", 100)),
+                        )
+                    case ["plan", *items]:
+                        self.solver = PlanRepairSolver(self.print, items)
+                    case ["portfolio", *args]:
+                        options, items = parse_options(args)
+                        strategies = options.get("strategies")
+                        seconds = options.get("seconds")
+                        self.solver = PortfolioRepairSolver(
+                            self.print,
+                            items,
+                            strategies=strategies.split(",") if strategies else None,
+                            seconds=float(seconds) if seconds else None,
+                            best=options.get("keep", "first") == "best",
+                        )
+                    case _:
+                        print(f"no solver for: {output}")
+                        return
+            except ValueError as e:
+                print(f"invalid options: {e}")
+                return
 
         cmds = self.solver.handle_output(output)
 
@@ -33,3 +101,6 @@ class AdventureSolver:
 
         for p in self.solver.pubs:
             self.print(f"found publication: {p}")
+
+        # The solver is done, entities it built are not used anymore
+        Item.reset()
@@ -0,0 +1,236 @@
+from collections import namedtuple
+
+from ...lib import Budget, Search
+from ..entities.compact import RepairSpace
+from ..entities.compat import CompatibilityMatrix
+from ..entities.inventory import MAX_SIZE
+from ..errors import InvalidState, Unfixable
+from ..explore import MapExplorer
+from .repair import BaseRepairSolver
+
+
+# Expanded states after which a repair is given up
+SEARCH_NODES = 200_000
+
+
+class Part(
+    namedtuple("Part", ["item", "target", "location", "parts"], defaults=[()])
+):
+    """
+    Node of a repair plan: concrete <item> found at <location> ("inv" and its
+    index in the inventory, or a room position and its index in the pile),
+    that becomes <target> once repaired with <parts>
+    """
+
+    __slots__ = ()
+
+    def all_items(self):
+        yield self.item
+        for part in self.parts:
+            yield from part.all_items()
+
+
+class PlanRepairSolver(BaseRepairSolver):
+    """
+    Solve repair task by choosing one item for each requirement and each of
+    its missing components first, then searching state space for each repair
+    in turn, components first
+    """
+
+    OUT_BASE = "solutions/adventure-plan-"
+
+    def can_become(self, state, item, target):
+        """
+        Whether <item> can become <target> with items of <state>, if each item
+        could be used more than once
+        """
+        key = (item, target)
+        if key not in self.fixable:
+            # Items missing themselves, even indirectly, are never fixed
+            self.fixable[key] = False
+            needed = self.compat.needed(item, target)
+            self.fixable[key] = needed is not None and all(
+                any(
+                    self.can_become(state, i, n)
+                    for _, _, i in self.locations.locate(state, n)
+                )
+                for n in needed
+            )
+        return self.fixable[key]
+
+    def candidates(self, state, target, used):
+        """
+        Yield (cost estimate, location, item) for items of <state> not in <used>
+        locations that can become <target>
+        """
+        explorer = MapExplorer.locate(state.room.name)
+        for pos, index, item in self.locations.locate(state, target):
+            if pos is None:
+                location = ("inv", index)
+                cost = 0
+            else:
+                # Take it, after taking and incinerating items above it
+                location = (pos, index)
+                cost = 1 + 2 * index + explorer.dist(state.pos, pos)
+            if location in used or not self.can_become(state, item, target):
+                continue
+
+            # And take and combine each missing component
+            cost += 2 * len(self.compat.needed(item, target))
+            yield cost, location, item
+
+    def plan(self, state, target, used):
+        """
+        Part tree for <target>, trying items cheapest first among <state> items
+        not in <used> locations, which are updated
+        """
+        candidates = sorted(self.candidates(state, target, used), key=lambda c: c[0])
+        for _, location, item in candidates:
+            # Missing items are sets, sort them so that plans are reproducible
+            needed = sorted(self.compat.needed(item, target), key=repr)
+            taken = used | {location}
+            try:
+                parts = tuple(self.plan(state, n, taken) for n in needed)
+            except Unfixable:
+                continue
+
+            used |= taken
+            return Part(item, target, location, parts)
+
+        raise Unfixable(f"No match for {target}")
+
+    def search(self, state, requirements, trash):
+        """
+        Commands from <state> to fulfill <requirements>, and the state they
+        lead to, or None
+        """
+        space = RepairSpace(state, trash)
+        search = Search(
+            space.start,
+            space.goal(requirements),
+            space.successors,
+            space.heuristic(requirements),
+            budget=Budget(nodes=SEARCH_NODES),
+        )
+        goal = search.run()
+        self.print(f"search: {requirements}: {search.stats}")
+
+        if goal is None:
+            return None
+        return space.commands(search.actions(goal)), space.game_state(goal)
+
+    def next_part(self, state, part, held):
+        """
+        Next (part, requirement) to get or repair for <part>, or None if <state>
+        inventory already holds it. Inventory items holding parts or parts being
+        repaired are added to <held>, index -> (part, requirement).
+        """
+        inv = state.inv.items
+        for index, item in enumerate(inv):
+            if index not in held and item.matches(part.target):
+                held[index] = (part, part.target)
+                return None
+
+        # Searches may repair parts as soon as they have their components, so
+        # the ones still needed depend on the item being repaired
+        for index, item in enumerate(inv):
+            if (
+                index not in held
+                and item.name == part.item.name
+                and part.item.can_become(item)
+                and item.can_become(part.target)
+            ):
+                held[index] = (part, item.as_generic())
+                needed = item.needed_to_become(part.target)
+                for p in part.parts:
+                    if p.target in needed:
+                        found = self.next_part(state, p, held)
+                        if found is not None:
+                            return found
+                return part, part.target
+
+        # Get the item to repair first so that its components can be combined
+        # into it as soon as they are held, which keeps inventory slots free,
+        # unless it would leave no room for them
+        location = self.locations.where(state, part.item)
+        if location is None or location[0] is None:
+            # Searches used another item than the planned one, the search for
+            # the part finds its own way
+            return part, part.target
+        if part.parts and len(inv) < MAX_SIZE - 1:
+            return part, part.item.as_generic()
+        for p in part.parts:
+            found = self.next_part(state, p, held)
+            if found is not None:
+                return found
+        return part, part.target
+
+    def combine_held(self, state, held):
+        """
+        Combine a component into the held part being repaired that needs it,
+        to free inventory slots. Components are held parts of it, or items not
+        held yet that searches took on the way. Return the command and the
+        state it leads to, or None.
+        """
+        inv = state.inv.items
+        for b, (part, _) in held.items():
+            if inv[b].matches(part.target):
+                continue
+            needed = inv[b].needed_to_become(part.target)
+            for c, item in enumerate(inv):
+                if c == b or (c in held and held[c][0] not in part.parts):
+                    continue
+                if not any(item.matches(n) for n in needed):
+                    continue
+                try:
+                    combined = state.inv.with_combined(inv[b], item)
+                except InvalidState:
+                    continue
+                command = f"combine {inv[b].full_name} with {item.full_name}"
+                return command, state._replace(inv=combined)
+
+    def solve(self, initial, requirements):
+        self.fixable = {}
+        self.compat = CompatibilityMatrix(initial.all_items)
+        self.locations = self.item_locations(initial)
+        used = set()
+        plans = [self.plan(initial, r, used) for r in requirements]
+
+        # Items left out of the plan are never needed
+        keep = {i for p in plans for i in p.all_items()}
+        trash = [i for i in initial.all_items if i not in keep]
+
+        # Get or repair one part at a time, keeping parts already held
+        commands = []
+        state = initial
+        while True:
+            held = {}
+            parts = [self.next_part(state, p, held) for p in plans]
+            found = next((p for p in parts if p is not None), None)
+            if found is None:
+                return commands
+            part, requirement = found
+
+            found = self.combine_held(state, held)
+            if found is not None:
+                command, state = found
+                commands.append(command)
+                continue
+
+            # Keep held parts, except the ones to combine into the next part
+            requirements = [r for _, r in held.values()]
+            if requirement is part.target:
+                requirements = [
+                    r
+                    for p, r in held.values()
+                    if p is not part and p not in part.parts
+                ]
+            found = self.search(state, [*requirements, requirement], trash)
+            if found is None and requirements:
+                # Held parts may have to be repaired on the way to make room
+                found = self.search(state, [requirement], trash)
+            if found is None or not found[0]:
+                return None
+
+            cmds, state = found
+            commands.extend(cmds)
@@ -0,0 +1,144 @@
+import multiprocessing
+import queue
+import time
+
+from .anytime import AnytimeRepairSolver
+from .astarrepair import AstarRepairSolver
+from .plan import PlanRepairSolver
+from .repair import BaseRepairSolver
+from ..errors import InvalidState
+
+
+# Strategy name -> (solver class, options), solvers are built in the workers.
+# Only the portfolio saves its solution, not the strategies.
+STRATEGIES = {
+    "astar": (AstarRepairSolver, {"heuristic": "off"}),
+    "bound": (AstarRepairSolver, {"heuristic": "bound"}),
+    "pdb": (AstarRepairSolver, {"heuristic": "pdb"}),
+    "anytime": (AnytimeRepairSolver, {"seconds": 60, "checkpoint": False}),
+    "plan": (PlanRepairSolver, {}),
+}
+
+
+def run_strategy(name, targets, initial, requirements, seconds, results):
+    """
+    Solve in a worker process with strategy <name>, anytime searches stopping
+    after <seconds> if given. Put (name, commands or None, error) on <results>.
+    """
+    try:
+        cls, options = STRATEGIES[name]
+        if cls is AnytimeRepairSolver and seconds:
+            options = {**options, "seconds": seconds}
+        solver = cls(lambda msg: None, targets, **options)
+        results.put((name, solver.solve(initial, requirements), None))
+    except Exception as e:
+        results.put((name, None, repr(e)))
+
+
+class PortfolioRepairSolver(BaseRepairSolver):
+    """
+    Solve repair task with several strategies at once, one process each, and
+    keep the first valid solution found, or with <best> the shortest one found
+    before <seconds> are spent
+    """
+
+    OUT_BASE = "solutions/adventure-portfolio-"
+
+    def __init__(self, printmsg, targets, strategies=None, seconds=None, best=False):
+        super().__init__(printmsg, targets)
+        unknown = [s for s in strategies or () if s not in STRATEGIES]
+        if unknown:
+            raise ValueError(
+                f"Unknown strategies {', '.join(unknown)},"
+                f" use some of {', '.join(STRATEGIES)}"
+            )
+
+        self.strategies = list(strategies or STRATEGIES)
+        self.seconds = seconds
+        self.best = best
+
+    def check(self, initial, requirements, commands):
+        """
+        Error replaying <commands> from <initial>, or None when they end with
+        <requirements> in the inventory
+        """
+        try:
+            final = initial.after(commands)
+        except InvalidState as e:
+            return str(e)
+
+        if not final.inv.matches(requirements):
+            return "requirements are not met"
+
+    def solve(self, initial, requirements):
+        start = time.perf_counter()
+        deadline = start + self.seconds if self.seconds else None
+        ctx = multiprocessing.get_context("fork")
+        results = ctx.Queue()
+        processes = {
+            name: ctx.Process(
+                target=run_strategy,
+                args=(name, self.targets, initial, requirements, self.seconds, results),
+                daemon=True,
+            )
+            for name in self.strategies
+        }
+        for process in processes.values():
+            process.start()
+
+        best = None
+        try:
+            pending = set(processes)
+            while pending and (best is None or self.best):
+                timeout = 1
+                if deadline is not None:
+                    timeout = min(timeout, deadline - time.perf_counter())
+                    if timeout <= 0:
+                        self.print("portfolio: out of time")
+                        break
+
+                try:
+                    name, commands, error = results.get(timeout=timeout)
+                except queue.Empty:
+                    # Strategies killed before reporting never will
+                    for name in [n for n in pending if not processes[n].is_alive()]:
+                        if results.empty():
+                            self.print(f"portfolio: {name} died")
+                            pending.discard(name)
+                    continue
+
+                pending.discard(name)
+                elapsed = time.perf_counter() - start
+                if error is not None:
+                    self.print(f"portfolio: {name} failed: {error}")
+                    continue
+
+                if commands is None:
+                    self.print(f"portfolio: {name} found no solution")
+                    continue
+
+                invalid = self.check(initial, requirements, commands)
+                if invalid is not None:
+                    self.print(f"portfolio: {name} found an invalid plan: {invalid}")
+                    continue
+
+                self.print(
+                    f"portfolio: {name} found {len(commands)} commands"
+                    f" in {elapsed:.2f}s"
+                )
+                if best is None or len(commands) < len(best[1]):
+                    best = (name, commands)
+        finally:
+            # Searches cannot be interrupted, stop the processes still running
+            for process in processes.values():
+                if process.is_alive():
+                    process.terminate()
+            for process in processes.values():
+                process.join()
+            results.close()
+
+        if best is None:
+            return None
+
+        self.print(f"portfolio: {best[0]} wins")
+        return best[1]
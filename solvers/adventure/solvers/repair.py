@@ -1,8 +1,9 @@
 from ..analyze import get_result
-from ..entities import GameState, item_from_name
+from ..entities import GameState, build, item_from_name
+from ..entities.locations import ItemLocations
 from ..errors import AdventureError
 from ..explore import MapExplorer
-from ..ml import parse_ml
+from ..ml import MLStream
 
 
 ST_INIT = 0
@@ -26,22 +27,46 @@ class BaseRepairSolver:
 
         self.targets = targets
         self.rooms = {}
+        self.locations = ItemLocations()
         self.pos = None
         self.explorer = None
         self.explore = None
         self.pubs = set()
+        self.results = []
+        self.stream = MLStream(self.results.append, self.pubs.add, build)
 
         self.state = ST_INIT
 
     def solve(self):
         raise NotImplementedError()
 
+    def item_locations(self, state):
+        """
+        Locations of items of <state>: the ones indexed while exploring, or new
+        ones when solving a state that was not explored
+        """
+        if not self.locations.sizes:
+            self.locations = ItemLocations(state)
+        return self.locations
+
+    def save(self, commands):
+        with open(self.OUT_BASE + "-".join(sorted(self.targets)), mode="w") as f:
+            f.write(f'# From "{self.room.name}"\n')
+            f.write("\n".join(commands) + "\n")
+
+    def feed(self, ch):
+        """
+        Parse machine output as it comes
+        """
+        self.stream.feed(ch)
+
     def handle_output(self, output):
         if self.state not in (ST_INIT, ST_FINISHED):
-            try:
-                parsed, pubs = parse_ml(output)
-                self.pubs.update(pubs)
+            # Only the result of the last command matters
+            parsed = self.results[-1] if self.results else None
+            self.results.clear()
 
+            try:
                 result = get_result(parsed)
             except AdventureError as e:
                 self.print(f"error: {e.args}")
@@ -65,6 +90,7 @@ class BaseRepairSolver:
         if self.state == ST_EXPLORING:
             self.room = result
             self.rooms[self.pos] = self.room
+            self.locations.add_room(self.pos, self.room)
 
             try:
                 self.pos, cmds = next(self.explore)
@@ -86,12 +112,7 @@ class BaseRepairSolver:
             if commands == None:
                 self.print("no solution found")
             else:
-                with open(
-                    self.OUT_BASE + "-".join(sorted(self.targets)), mode="w"
-                ) as f:
-                    f.write(f'# From "{self.room.name}"\n')
-                    f.write("\n".join(commands) + "\n")
-
+                self.save(commands)
                 return commands
 
         if self.state == ST_FINISHING:
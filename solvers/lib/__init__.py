@@ -0,0 +1,14 @@
+from .anytime import Budget, Incumbent, anytime, beam_search, weighted_astar
+from .dominance import DominanceIndex
+from .external import ExternalSearch
+from .parallel import ParallelSearch
+from .route import plan_route
+from .search import (
+    ASTAR_COST,
+    ASTAR_GOAL,
+    ASTAR_PATHS,
+    Search,
+    SearchStats,
+    astar,
+    edges,
+)
@@ -0,0 +1,212 @@
+"""
+Anytime search: find a solution quickly, then improve it while budget remains
+"""
+
+import math
+import time
+
+from .search import Search
+
+
+# Decreasing weights for successive weighted A* runs, the last one is optimal
+WEIGHTS = (5, 3, 2, 1.5, 1)
+
+BEAM_WIDTH = 100
+
+
+class Budget:
+    """
+    Wall-clock and expanded nodes budget, shared by successive searches
+    """
+
+    # Expansions between clock checks
+    CLOCK_EVERY = 256
+
+    def __init__(self, seconds=None, nodes=None):
+        self.deadline = time.perf_counter() + seconds if seconds else None
+        self.nodes = nodes
+        self.spent = 0
+        self.expired = False
+
+    def spend(self, nodes=1):
+        """
+        Account for <nodes> expansions, return True once the budget is exhausted
+        """
+        self.spent += nodes
+        if self.nodes is not None and self.spent >= self.nodes:
+            self.expired = True
+        elif (
+            self.deadline is not None
+            and self.spent % self.CLOCK_EVERY < nodes
+            and time.perf_counter() >= self.deadline
+        ):
+            self.expired = True
+        return self.expired
+
+
+class Incumbent:
+    """
+    Best solution found so far, on_solution(goal, cost, actions) is called each
+    time it improves. Searches stop once it costs no more than <lower_bound>,
+    as no solution can be cheaper.
+    """
+
+    def __init__(self, on_solution=None, lower_bound=0):
+        self.goal = None
+        self.cost = math.inf
+        self.actions = None
+        self.on_solution = on_solution
+        self.lower_bound = lower_bound
+
+    @property
+    def optimal(self):
+        return self.cost <= self.lower_bound
+
+    def offer(self, goal, cost, actions):
+        if cost >= self.cost:
+            return False
+
+        self.goal, self.cost, self.actions = goal, cost, actions
+        if self.on_solution:
+            self.on_solution(goal, cost, actions)
+        return True
+
+
+def weighted_astar(
+    start,
+    is_goal,
+    successors,
+    heuristic=lambda p: 0,
+    weights=WEIGHTS,
+    budget=None,
+    incumbent=None,
+    **options,
+):
+    """
+    Run weighted A* with each of <weights> in turn, every run being bounded by
+    the best solution found so far, until the weights or the budget run out.
+    See Search for parameters.
+
+    Returns the Incumbent holding the best solution.
+    """
+    incumbent = incumbent or Incumbent()
+    budget = budget or Budget()
+
+    for weight in weights:
+        if incumbent.optimal:
+            break
+
+        search = Search(
+            start,
+            is_goal,
+            successors,
+            heuristic,
+            weight=weight,
+            bound=incumbent.cost,
+            budget=budget,
+            **options,
+        )
+        goal = search.run()
+        if goal is not None:
+            incumbent.offer(goal, search.cost(goal), search.actions(goal))
+        if search.expired:
+            break
+
+        # A complete unweighted run finds no solution cheaper than the incumbent
+        if weight == 1:
+            incumbent.lower_bound = incumbent.cost
+
+    return incumbent
+
+
+def beam_search(
+    start,
+    is_goal,
+    successors,
+    heuristic=lambda p: 0,
+    width=BEAM_WIDTH,
+    budget=None,
+    incumbent=None,
+    key=None,
+):
+    """
+    Breadth-first search keeping only the <width> most promising points of
+    each layer, until no layer is left or the budget runs out. Successive
+    goals improve the incumbent.
+
+    Returns the Incumbent holding the best solution.
+    """
+    incumbent = incumbent or Incumbent()
+    budget = budget or Budget()
+    key = key or (lambda p: p)
+
+    # key -> best cost, for points in all layers so far
+    seen = {key(start): 0}
+    layer = [(heuristic(start), 0, start, ())]
+
+    while layer:
+        nxt_layer = {}
+        for _, cost, point, actions in layer:
+            if is_goal(point):
+                incumbent.offer(point, cost, list(actions))
+                if incumbent.optimal:
+                    return incumbent
+                continue
+
+            if budget.spend():
+                return incumbent
+
+            for nxt, step, action in successors(point):
+                nxt_cost = cost + step
+                nxt_key = key(nxt)
+                if seen.get(nxt_key, math.inf) <= nxt_cost:
+                    continue
+
+                f = nxt_cost + heuristic(nxt)
+                if f >= incumbent.cost:
+                    continue
+
+                seen[nxt_key] = nxt_cost
+                nxt_layer[nxt_key] = (f, nxt_cost, nxt, (*actions, action))
+
+        # Sort on priority then cost only, points are never compared
+        layer = sorted(nxt_layer.values(), key=lambda e: e[:2])[:width]
+
+    return incumbent
+
+
+def anytime(
+    start,
+    is_goal,
+    successors,
+    heuristic=lambda p: 0,
+    width=BEAM_WIDTH,
+    weights=WEIGHTS,
+    budget=None,
+    on_solution=None,
+    key=None,
+):
+    """
+    Beam search for a first solution, then weighted A* with decreasing weights
+    to improve it, all within <budget>. The heuristic of start is a lower bound
+    on the cost of solutions, searches stop early if one reaches it.
+
+    Returns the Incumbent holding the best solution.
+    """
+    budget = budget or Budget()
+    incumbent = Incumbent(on_solution, heuristic(start))
+
+    beam_search(start, is_goal, successors, heuristic, width, budget, incumbent, key)
+    if not budget.expired and not incumbent.optimal:
+        weighted_astar(
+            start,
+            is_goal,
+            successors,
+            heuristic,
+            weights,
+            budget,
+            incumbent,
+            key=key,
+        )
+
+    return incumbent
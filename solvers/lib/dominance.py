@@ -0,0 +1,45 @@
+"""
+Dominance pruning: drop points that are no better than a point already expanded
+
+A point a dominates a point b when every path from b to a goal can be matched
+by a path from a that is no longer. Once a was expanded at some cost, b reached
+at the same cost or more cannot lead to a cheaper goal, and expanding it again
+is wasted. Only points sharing a key are compared, so that checks stay cheap.
+"""
+
+
+class DominanceIndex:
+    """
+    Expanded points grouped by key(point), with dominates(a, b) telling whether
+    point a dominates point b of the same key
+    """
+
+    def __init__(self, key, dominates):
+        self.key = key
+        self.dominates = dominates
+        self.buckets = {}
+        self.checks = 0
+        self.pruned = 0
+
+    def dominated(self, point, cost):
+        """
+        Whether <point> reached at <cost> is dominated by an expanded point
+        """
+        for expanded_cost, expanded in self.buckets.get(self.key(point), ()):
+            self.checks += 1
+            if expanded_cost <= cost and self.dominates(expanded, point):
+                self.pruned += 1
+                return True
+        return False
+
+    def add(self, point, cost):
+        """
+        Record <point> as expanded at <cost>
+        """
+        bucket = self.buckets.setdefault(self.key(point), [])
+
+        # Points the new one dominates would only prune points it prunes too
+        bucket[:] = [
+            (c, p) for c, p in bucket if c < cost or not self.dominates(point, p)
+        ]
+        bucket.append((cost, point))
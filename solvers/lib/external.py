@@ -0,0 +1,297 @@
+"""
+External-memory best-first search with delayed duplicate detection
+
+Points are handled as compact keys produced by an encoder, and grouped in
+buckets by priority (cost plus heuristic). Generated points are buffered in
+memory and, when the buffer is full, spilled to disk as runs sorted by key.
+Duplicates are only detected when a bucket is expanded: its runs are merged,
+keeping the cheapest record of each key, and keys that were already expanded
+are removed by merging against the sorted runs of expanded records.
+
+Records are (key, cost, parent, action), parent being the expanded bucket run
+and index in it of the record of the parent point. Expanded runs are kept with
+an index of record offsets, so once a goal is found its path is rebuilt by
+reading a single record per step. The heuristic must be consistent for the
+first goal found to be optimal.
+"""
+
+import heapq
+from itertools import groupby
+import math
+import os
+import pickle
+import shutil
+import struct
+import tempfile
+import time
+
+from .search import SearchStats
+
+
+# Records kept in memory before spilling a run to disk
+MEMORY = 1 << 20
+
+# Expanded runs are merged together when there are more than this
+MAX_CLOSED_RUNS = 16
+
+
+class Run:
+    """
+    File holding records sorted by key, and with <indexed> a file of their
+    offsets so that they can be read by index
+    """
+
+    def __init__(self, path, records, indexed=False):
+        self.path = path
+        self.index_path = f"{path}.idx" if indexed else None
+        self.size = 0
+        offsets = []
+        with open(path, mode="wb") as f:
+            pickler = pickle.Pickler(f, protocol=pickle.HIGHEST_PROTOCOL)
+            for rec in records:
+                if indexed:
+                    offsets.append(f.tell())
+                    if len(offsets) == MEMORY:
+                        self.write_offsets(offsets)
+                pickler.dump(rec)
+                # Records are independent, do not let the memo grow
+                pickler.clear_memo()
+                self.size += 1
+
+        if indexed:
+            self.write_offsets(offsets)
+
+    def write_offsets(self, offsets):
+        with open(self.index_path, mode="ab") as f:
+            f.write(struct.pack(f">{len(offsets)}Q", *offsets))
+        offsets.clear()
+
+    def __getitem__(self, i):
+        with open(self.index_path, mode="rb") as f:
+            f.seek(8 * i)
+            (offset,) = struct.unpack(">Q", f.read(8))
+        with open(self.path, mode="rb") as f:
+            f.seek(offset)
+            return pickle.load(f)
+
+    def __iter__(self):
+        with open(self.path, mode="rb") as f:
+            unpickler = pickle.Unpickler(f)
+            for _ in range(self.size):
+                yield unpickler.load()
+
+    def remove(self):
+        os.unlink(self.path)
+        if self.index_path:
+            os.unlink(self.index_path)
+
+
+def by_key(rec):
+    return rec[0]
+
+
+def cheapest(records):
+    """
+    Keep the cheapest record of each key from records sorted by key
+    """
+    for _, group in groupby(records, key=by_key):
+        yield min(group, key=lambda rec: rec[1])
+
+
+def unseen(records, closed):
+    """
+    Records sorted by key whose key is not in sorted <closed> records
+    """
+    closed = iter(closed)
+    seen = next(closed, None)
+    for rec in records:
+        while seen is not None and seen[0] < rec[0]:
+            seen = next(closed, None)
+        if seen is None or seen[0] != rec[0]:
+            yield rec
+
+
+class ExternalSearch:
+    """
+    Best-first search keeping at most <memory> generated records in memory
+        start, is_goal, successors, heuristic: see Search
+        encode(p) => bytes identifying p, compact and decodable
+        decode(bytes) => point
+        tmpdir: where run files are written, a temporary directory by default
+        hook(stats): called every <hook_every> expansions and when done
+    """
+
+    def __init__(
+        self,
+        start,
+        is_goal,
+        successors,
+        encode,
+        decode,
+        heuristic=lambda p: 0,
+        memory=MEMORY,
+        tmpdir=None,
+        hook=None,
+        hook_every=10000,
+    ):
+        self.start = start
+        self.is_goal = is_goal
+        self.successors = successors
+        self.encode = encode
+        self.decode = decode
+        self.heuristic = heuristic
+        self.memory = memory
+        self.tmpdir = tmpdir
+        self.hook = hook
+        self.hook_every = hook_every
+
+        self.stats = SearchStats()
+        self.stats.spilled = 0
+        self.goal = None
+        self.goal_ref = None
+
+        # priority -> [...records] in memory, and [...Run] on disk
+        self.buffers = {}
+        self.runs = {}
+        self.buffered = 0
+        self.priorities = []
+        self.expanded = []
+        self.closed = []
+        self.run_count = 0
+
+    def run_path(self):
+        self.run_count += 1
+        return os.path.join(self.dir, f"{self.run_count:08d}.run")
+
+    def add(self, priority, rec):
+        if priority not in self.buffers and priority not in self.runs:
+            heapq.heappush(self.priorities, priority)
+        self.buffers.setdefault(priority, []).append(rec)
+        self.buffered += 1
+
+        if self.buffered > self.memory:
+            self.spill()
+
+    def spill(self):
+        """
+        Write the largest buffer to disk as a sorted run
+        """
+        priority = max(self.buffers, key=lambda p: len(self.buffers[p]))
+        records = self.buffers.pop(priority)
+        records.sort(key=by_key)
+        run = Run(self.run_path(), cheapest(records))
+        self.runs.setdefault(priority, []).append(run)
+
+        self.buffered -= len(records)
+        self.stats.spilled += run.size
+
+    def add_closed(self, run):
+        self.closed.append(run)
+
+        # Expanded runs are kept for paths, merged runs only need keys
+        if len(self.closed) > MAX_CLOSED_RUNS:
+            merged = Run(
+                self.run_path(),
+                ((rec[0],) for rec in heapq.merge(*self.closed, key=by_key)),
+            )
+            for run in self.closed:
+                if run.index_path is None:
+                    run.remove()
+            self.closed = [merged]
+
+    def take_bucket(self, priority):
+        """
+        Remove bucket <priority> and return its records that were not expanded
+        yet, sorted by key and without duplicates, as an indexed run
+        """
+        runs = self.runs.pop(priority, [])
+        records = self.buffers.pop(priority, [])
+        self.buffered -= len(records)
+        records.sort(key=by_key)
+
+        merged = cheapest(heapq.merge(records, *runs, key=by_key))
+        run = Run(
+            self.run_path(),
+            unseen(merged, heapq.merge(*self.closed, key=by_key)),
+            indexed=True,
+        )
+        for r in runs:
+            r.remove()
+        return run
+
+    def run(self):
+        """
+        Search until a goal is found and return it, or return None
+        """
+        self.dir = tempfile.mkdtemp(prefix="search-", dir=self.tmpdir)
+        stats = self.stats
+
+        try:
+            start = (self.encode(self.start), 0, None, None)
+            self.add(self.heuristic(self.start), start)
+
+            while self.priorities:
+                priority = heapq.heappop(self.priorities)
+
+                # Successors may land in the bucket being expanded, in which
+                # case it is expanded again
+                while priority in self.buffers or priority in self.runs:
+                    bucket = self.take_bucket(priority)
+                    self.expanded.append(bucket)
+                    ident = len(self.expanded) - 1
+
+                    for index, (key, cost, _, _) in enumerate(bucket):
+                        point = self.decode(key)
+                        if self.is_goal(point):
+                            self.goal, self.goal_ref = point, (ident, index)
+                            self.add_closed(bucket)
+                            return point
+
+                        stats.expanded += 1
+                        if self.hook and stats.expanded % self.hook_every == 0:
+                            stats.elapsed = time.perf_counter() - stats.started
+                            self.hook(stats)
+
+                        for nxt, step, action in self.successors(point):
+                            stats.generated += 1
+                            h = self.heuristic(nxt)
+                            if h == math.inf:
+                                continue
+                            nxt_cost = cost + step
+                            self.add(
+                                nxt_cost + h,
+                                (self.encode(nxt), nxt_cost, (ident, index), action),
+                            )
+
+                    self.add_closed(bucket)
+
+                    stats.frontier_peak = max(
+                        stats.frontier_peak,
+                        self.buffered
+                        + sum(r.size for rs in self.runs.values() for r in rs),
+                    )
+
+            return None
+        finally:
+            stats.elapsed = time.perf_counter() - stats.started
+            if self.hook:
+                self.hook(stats)
+
+    def actions(self):
+        """
+        Actions leading from start to the goal, following parent references
+        from the goal record. Must be called before cleanup().
+        """
+        ref = self.goal_ref
+        actions = []
+        while ref is not None:
+            ident, index = ref
+            _, _, ref, action = self.expanded[ident][index]
+            if ref is not None:
+                actions.append(action)
+
+        actions.reverse()
+        return actions
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
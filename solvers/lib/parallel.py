@@ -0,0 +1,373 @@
+"""
+Hash-distributed parallel best-first search (HDA*)
+
+Points are partitioned across worker processes by a hash: each
+worker owns the points of its partition, keeps their best known cost and runs
+its own A* on them. Successors owned by other workers are buffered and sent to
+them in batches. Goals are reported to the coordinator (the calling process),
+which broadcasts the best cost found so far as a bound to all workers; the
+search ends when no worker has a point below that bound left to expand and no
+batch is in flight.
+
+Each worker records the parent and action of the points it owns, and points
+cross partitions with their parent. Once the search is over, the path to the
+goal is rebuilt by asking the owner of each point on it for its parent in turn.
+
+Workers are forked, so callables may be closures and points are only pickled
+when they cross partitions.
+"""
+
+import heapq
+from itertools import count
+import math
+import multiprocessing
+import queue
+import time
+
+from .search import SearchStats
+
+
+# Points sent to another worker in a single message
+BATCH_SIZE = 256
+
+# Expansions between flushes of partially filled batches
+FLUSH_EVERY = 64
+
+# Seconds an idle worker waits for messages before checking again
+IDLE_WAIT = 0.05
+
+MSG_POINTS = 0
+MSG_BOUND = 1
+MSG_PROBE = 2
+MSG_STOP = 3
+MSG_TRACE = 4
+
+MSG_GOAL = 10
+MSG_IDLE = 11
+MSG_PROBED = 12
+MSG_STATS = 13
+MSG_ERROR = 14
+MSG_TRACED = 15
+
+
+class Worker:
+    """
+    One partition of a parallel search, running in its own process
+    """
+
+    def __init__(self, search, ident, inboxes, coordinator):
+        self.search = search
+        self.ident = ident
+        self.inboxes = inboxes
+        self.inbox = inboxes[ident]
+        self.coordinator = coordinator
+
+        self.stats = SearchStats()
+        self.best = {}
+        self.frontier = []
+        self.tiebreak = count()
+        self.outboxes = [[] for _ in inboxes]
+        self.bound = math.inf
+        self.sent = 0
+        self.received = 0
+        self.stopped = False
+
+    def owner(self, point):
+        return self.search.partition(point) % len(self.inboxes)
+
+    def push(self, point, cost, parent, action):
+        key = self.search.point_key(point)
+        old = self.best.get(key)
+        if old is not None and cost >= old[0]:
+            return
+        if old is not None:
+            self.stats.reopened += 1
+
+        self.best[key] = (cost, parent, action)
+        f = cost + self.search.weight * self.search.heuristic(point)
+        if f < self.bound:
+            heapq.heappush(self.frontier, (f, next(self.tiebreak), cost, key, point))
+            if len(self.frontier) > self.stats.frontier_peak:
+                self.stats.frontier_peak = len(self.frontier)
+
+    def route(self, point, cost, parent, action):
+        owner = self.owner(point)
+        if owner == self.ident:
+            self.push(point, cost, parent, action)
+            return
+
+        outbox = self.outboxes[owner]
+        outbox.append((point, cost, parent, action))
+        if len(outbox) >= BATCH_SIZE:
+            self.flush(owner)
+
+    def flush(self, owner=None):
+        for i in range(len(self.inboxes)) if owner is None else (owner,):
+            if self.outboxes[i]:
+                self.inboxes[i].put((MSG_POINTS, self.outboxes[i]))
+                self.outboxes[i] = []
+                self.sent += 1
+
+    def handle(self, msg):
+        kind = msg[0]
+        if kind == MSG_POINTS:
+            self.received += 1
+            for point, cost, parent, action in msg[1]:
+                self.push(point, cost, parent, action)
+        elif kind == MSG_BOUND:
+            self.bound = min(self.bound, msg[1])
+        elif kind == MSG_PROBE:
+            self.drain()
+            self.coordinator.put(
+                (MSG_PROBED, self.ident, self.idle(), self.sent, self.received)
+            )
+        elif kind == MSG_TRACE:
+            _, parent, action = self.best[self.search.point_key(msg[1])]
+            self.coordinator.put((MSG_TRACED, parent, action))
+        elif kind == MSG_STOP:
+            self.stopped = True
+
+    def drain(self):
+        while not self.stopped:
+            try:
+                msg = self.inbox.get_nowait()
+            except queue.Empty:
+                return
+            self.handle(msg)
+
+    def idle(self):
+        return not self.frontier or self.frontier[0][0] >= self.bound
+
+    def expand(self):
+        f, _, cost, key, point = heapq.heappop(self.frontier)
+        if cost > self.best[key][0]:
+            self.stats.stale += 1
+            return
+
+        if self.search.is_goal(point):
+            if cost < self.bound:
+                self.bound = cost
+                self.coordinator.put((MSG_GOAL, self.ident, cost, point))
+            return
+
+        self.stats.expanded += 1
+        for nxt, step, action in self.search.successors(point):
+            self.stats.generated += 1
+            self.route(nxt, cost + step, point, action)
+
+    def run(self):
+        try:
+            self.loop()
+        except Exception as e:
+            self.coordinator.put((MSG_ERROR, self.ident, repr(e)))
+            raise
+
+        self.stats.elapsed = time.perf_counter() - self.stats.started
+        self.coordinator.put((MSG_STATS, self.ident, self.stats))
+
+    def loop(self):
+        reported = None
+        while not self.stopped:
+            n = 0
+            while not self.idle() and not self.stopped:
+                self.expand()
+                n += 1
+                if n % FLUSH_EVERY == 0:
+                    self.flush()
+                    self.drain()
+            self.flush()
+
+            # Tell the coordinator each time counters change while idle
+            status = (self.sent, self.received)
+            if status != reported:
+                self.coordinator.put(
+                    (MSG_IDLE, self.ident, self.sent, self.received)
+                )
+                reported = status
+
+            try:
+                msg = self.inbox.get(timeout=IDLE_WAIT)
+            except queue.Empty:
+                continue
+            self.handle(msg)
+            self.drain()
+
+
+class ParallelSearch:
+    """
+    Best-first search distributed over <workers> processes, see Search for
+    parameters. <partition>(p) must return the same integer for points with
+    equal keys in all workers; it defaults to hash(), which is only safe for
+    points that do not hash by identity.
+
+    Once the search is done, actions() returns the actions from start to the
+    goal.
+    """
+
+    def __init__(
+        self,
+        start,
+        is_goal,
+        successors,
+        heuristic=lambda p: 0,
+        key=None,
+        weight=1,
+        workers=2,
+        partition=hash,
+        hook=None,
+    ):
+        self.start = start
+        self.is_goal = is_goal
+        self.successors = successors
+        self.heuristic = heuristic
+        self.key = key
+        self.weight = weight
+        self.workers = workers
+        self.partition = partition
+        self.hook = hook
+
+        self.stats = SearchStats()
+        self.worker_stats = []
+        self.goal = None
+        self.goal_cost = math.inf
+        self.goal_actions = None
+
+    def point_key(self, point):
+        return self.key(point) if self.key else point
+
+    def run(self):
+        """
+        Search until no better goal can be found, return the best goal found or
+        None
+        """
+        ctx = multiprocessing.get_context("fork")
+        inboxes = [ctx.Queue() for _ in range(self.workers)]
+        coordinator = ctx.Queue()
+
+        processes = [
+            ctx.Process(
+                target=lambda i: Worker(self, i, inboxes, coordinator).run(),
+                args=(i,),
+                daemon=True,
+            )
+            for i in range(self.workers)
+        ]
+        for p in processes:
+            p.start()
+
+        try:
+            owner = self.partition(self.start) % self.workers
+            inboxes[owner].put((MSG_POINTS, [(self.start, 0, None, None)]))
+            self.coordinate(inboxes, coordinator, processes)
+            if self.goal is not None:
+                self.goal_actions = self.trace(inboxes, coordinator)
+        finally:
+            for inbox in inboxes:
+                inbox.put((MSG_STOP,))
+            self.collect(coordinator)
+            for p in processes:
+                p.join(timeout=1)
+                if p.is_alive():
+                    p.terminate()
+
+        return self.goal
+
+    def coordinate(self, inboxes, coordinator, processes):
+        """
+        Track goals and worker counters until the search is over. Workers
+        report counters of batches sent and received when they go idle; when
+        all of them are idle and the totals match, they are probed once more
+        to make sure no batch was in flight.
+        """
+        # Batch sent to the owner of start
+        sent = 1
+        idle = {}
+        probe = None
+
+        while True:
+            try:
+                msg = coordinator.get(timeout=1)
+            except queue.Empty:
+                if not all(p.is_alive() for p in processes):
+                    raise Exception("Search worker died")
+                continue
+
+            kind = msg[0]
+            if kind == MSG_ERROR:
+                raise Exception(f"Search worker {msg[1]} failed: {msg[2]}")
+            elif kind == MSG_GOAL:
+                _, _, cost, point = msg
+                if cost < self.goal_cost:
+                    self.goal, self.goal_cost = point, cost
+                    for inbox in inboxes:
+                        inbox.put((MSG_BOUND, cost))
+            elif kind == MSG_IDLE:
+                _, ident, w_sent, w_received = msg
+                idle[ident] = (w_sent, w_received)
+            elif kind == MSG_PROBED and probe is not None:
+                _, ident, w_idle, w_sent, w_received = msg
+                probe[ident] = (w_sent, w_received) if w_idle else None
+                if len(probe) == self.workers:
+                    if None not in probe.values() and probe == idle:
+                        return
+                    probe = None
+
+            if probe is None and len(idle) == self.workers:
+                total_sent = sent + sum(s for s, _ in idle.values())
+                total_received = sum(r for _, r in idle.values())
+                if total_sent == total_received:
+                    probe = {}
+                    for inbox in inboxes:
+                        inbox.put((MSG_PROBE,))
+
+    def trace(self, inboxes, coordinator):
+        """
+        Actions from start to the goal, following parents recorded by the
+        owners of the points on the path
+        """
+        actions = []
+        point = self.goal
+        while True:
+            inboxes[self.partition(point) % self.workers].put((MSG_TRACE, point))
+            while True:
+                msg = coordinator.get(timeout=5)
+                if msg[0] == MSG_ERROR:
+                    raise Exception(f"Search worker {msg[1]} failed: {msg[2]}")
+                if msg[0] == MSG_TRACED:
+                    break
+
+            _, point, action = msg
+            if point is None:
+                break
+            actions.append(action)
+
+        actions.reverse()
+        return actions
+
+    def actions(self):
+        return self.goal_actions
+
+    def collect(self, coordinator):
+        """
+        Gather stats from workers once they are stopped
+        """
+        deadline = time.perf_counter() + 5
+        while len(self.worker_stats) < self.workers:
+            try:
+                msg = coordinator.get(timeout=max(0, deadline - time.perf_counter()))
+            except queue.Empty:
+                break
+            if msg[0] == MSG_STATS:
+                self.worker_stats.append(msg[2])
+
+        stats = self.stats
+        for ws in self.worker_stats:
+            stats.expanded += ws.expanded
+            stats.generated += ws.generated
+            stats.stale += ws.stale
+            stats.reopened += ws.reopened
+            stats.frontier_peak += ws.frontier_peak
+        stats.elapsed = time.perf_counter() - stats.started
+
+        if self.hook:
+            self.hook(stats)
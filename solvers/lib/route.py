@@ -0,0 +1,104 @@
+"""
+Route planning: shortest open route from a start point visiting all points
+"""
+
+# Above this many points to visit, Held-Karp is too slow and heuristics are used
+HELD_KARP_MAX = 13
+
+
+def route_length(route, dist):
+    return sum(dist(a, b) for a, b in zip(route, route[1:]))
+
+
+def held_karp(start, points, dist):
+    """
+    Exact shortest route from <start> through all <points> with bitmask
+    dynamic programming, in O(2^n * n^2)
+    """
+    points = [p for p in points if p != start]
+    n = len(points)
+    if not n:
+        return [start]
+
+    d = [[dist(a, b) for b in points] for a in points]
+    full = (1 << n) - 1
+
+    # cost[mask][j]: shortest route from start through points in mask, ending
+    # at point j; parent[mask][j] is the point visited before j
+    inf = float("inf")
+    cost = [[inf] * n for _ in range(full + 1)]
+    parent = [[None] * n for _ in range(full + 1)]
+    for j in range(n):
+        cost[1 << j][j] = dist(start, points[j])
+
+    for mask in range(1, full + 1):
+        row = cost[mask]
+        for j in range(n):
+            c = row[j]
+            if c == inf:
+                continue
+            dj = d[j]
+            for k in range(n):
+                if mask & (1 << k):
+                    continue
+                nxt = mask | (1 << k)
+                nc = c + dj[k]
+                if nc < cost[nxt][k]:
+                    cost[nxt][k] = nc
+                    parent[nxt][k] = j
+
+    end = min(range(n), key=lambda j: cost[full][j])
+    route = []
+    mask = full
+    while end is not None:
+        route.append(points[end])
+        end, mask = parent[mask][end], mask & ~(1 << end)
+    route.append(start)
+    route.reverse()
+    return route
+
+
+def nearest_neighbour(start, points, dist):
+    """
+    Route going to the closest point not visited yet each time
+    """
+    left = [p for p in points if p != start]
+    route = [start]
+    while left:
+        cur = route[-1]
+        nxt = min(left, key=lambda p: dist(cur, p))
+        left.remove(nxt)
+        route.append(nxt)
+    return route
+
+
+def two_opt(route, dist):
+    """
+    Improve a route by reversing segments while it gets shorter, the first
+    point stays first
+    """
+    route = list(route)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, len(route) - 1):
+            for j in range(i + 1, len(route)):
+                before = dist(route[i - 1], route[i])
+                after = dist(route[i - 1], route[j])
+                if j + 1 < len(route):
+                    before += dist(route[j], route[j + 1])
+                    after += dist(route[i], route[j + 1])
+                if after < before:
+                    route[i : j + 1] = reversed(route[i : j + 1])
+                    improved = True
+    return route
+
+
+def plan_route(start, points, dist):
+    """
+    Shortest (or short, for many points) route from <start> visiting all
+    <points>, as a list of points starting with <start>
+    """
+    if len([p for p in points if p != start]) <= HELD_KARP_MAX:
+        return held_karp(start, points, dist)
+    return two_opt(nearest_neighbour(start, points, dist), dist)
@@ -0,0 +1,266 @@
+from itertools import count
+import heapq
+import math
+import time
+
+ASTAR_PATHS = 1
+ASTAR_COST = 2
+ASTAR_GOAL = 4
+
+
+class SearchStats:
+    """
+    Counters updated by a search while it runs
+    """
+
+    def __init__(self):
+        self.expanded = 0
+        self.generated = 0
+        self.stale = 0
+        self.reopened = 0
+        self.dominated = 0
+        self.frontier_peak = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0
+
+    def __repr__(self):
+        return (
+            f"{self.expanded} expanded, {self.generated} generated, "
+            f"{self.stale} stale, {self.reopened} reopened, "
+            f"{self.dominated} dominated, "
+            f"frontier peak {self.frontier_peak}, {self.elapsed:.3f}s"
+        )
+
+
+class Search:
+    """
+    Best-first search engine
+        start: point
+        is_goal(p) => bool
+        successors(p) => [...(point, cost, action)]
+        heuristic(p) => number, should be admissible
+        key(p) => hashable identifying p, defaults to p itself
+        closed: never expand a point twice, even when a cheaper path to it
+            is found later (which cannot happen with a consistent heuristic)
+        weight: multiplies the heuristic, >1 finds solutions faster but they
+            may cost up to <weight> times the optimal cost
+        hook(stats): called every <hook_every> expansions and when done
+        order(p) => comparable, breaks ties between equal priorities before
+            insertion order does
+        bound: ignore points whose cost plus heuristic reaches it, typically
+            the cost of a solution found earlier
+        budget: Budget shared with other searches, the search gives up and
+            sets .expired when it runs out
+        dominance: DominanceIndex, points dominated by a point expanded at no
+            higher cost are dropped instead of being expanded
+
+    Frontier entries that became stale because a cheaper path to the same
+    point was found are skipped when popped (lazy deletion). Ties between
+    equal priorities are broken by <order> then insertion order, so points
+    themselves are never compared.
+
+    Each point is recorded once, along with its cost and the key of its
+    parent, so paths are rebuilt by following parent keys from the goal.
+    """
+
+    def __init__(
+        self,
+        start,
+        is_goal,
+        successors,
+        heuristic=lambda p: 0,
+        key=None,
+        closed=True,
+        weight=1,
+        hook=None,
+        hook_every=10000,
+        order=None,
+        bound=math.inf,
+        budget=None,
+        dominance=None,
+    ):
+        self.start = start
+        self.is_goal = is_goal
+        self.successors = successors
+        self.heuristic = heuristic
+        self.key = key
+        self.closed = set() if closed else None
+        self.weight = weight
+        self.hook = hook
+        self.hook_every = hook_every
+        self.order = order
+        self.bound = bound
+        self.budget = budget
+        self.dominance = dominance
+        self.expired = False
+        self.stats = SearchStats()
+
+        # key -> (cost, parent key, action, point)
+        self.records = {}
+
+    def run(self):
+        """
+        Search until a goal is found and return it, or return None
+        """
+        stats = self.stats
+        records = self.records
+        closed = self.closed
+        key = self.key
+        heuristic = self.heuristic
+        weight = self.weight
+        order = self.order
+        bound = self.bound
+        budget = self.budget
+        dominance = self.dominance
+        tiebreak = count()
+
+        start_key = key(self.start) if key else self.start
+        records[start_key] = (0, None, None, self.start)
+        frontier = [
+            (
+                weight * heuristic(self.start),
+                order(self.start) if order else 0,
+                next(tiebreak),
+                0,
+                start_key,
+            )
+        ]
+
+        try:
+            while frontier:
+                _, _, _, cost, cur_key = heapq.heappop(frontier)
+                rec_cost, _, _, cur = records[cur_key]
+
+                if cost > rec_cost or (closed is not None and cur_key in closed):
+                    stats.stale += 1
+                    continue
+
+                if self.is_goal(cur):
+                    return cur
+
+                if dominance is not None:
+                    if dominance.dominated(cur, cost):
+                        stats.dominated += 1
+                        continue
+                    dominance.add(cur, cost)
+
+                if closed is not None:
+                    closed.add(cur_key)
+
+                stats.expanded += 1
+                if self.hook and stats.expanded % self.hook_every == 0:
+                    stats.elapsed = time.perf_counter() - stats.started
+                    self.hook(stats)
+
+                if budget is not None and budget.spend():
+                    self.expired = True
+                    return None
+
+                for nxt, step, action in self.successors(cur):
+                    stats.generated += 1
+                    nxt_key = key(nxt) if key else nxt
+                    nxt_cost = cost + step
+
+                    old = records.get(nxt_key)
+                    if old is not None:
+                        if nxt_cost >= old[0]:
+                            continue
+                        if closed is not None and nxt_key in closed:
+                            continue
+                        stats.reopened += 1
+
+                    h = heuristic(nxt)
+                    if nxt_cost + h >= bound:
+                        continue
+
+                    records[nxt_key] = (nxt_cost, cur_key, action, nxt)
+                    heapq.heappush(
+                        frontier,
+                        (
+                            nxt_cost + weight * h,
+                            order(nxt) if order else 0,
+                            next(tiebreak),
+                            nxt_cost,
+                            nxt_key,
+                        ),
+                    )
+
+                if len(frontier) > stats.frontier_peak:
+                    stats.frontier_peak = len(frontier)
+
+            return None
+        finally:
+            stats.elapsed = time.perf_counter() - stats.started
+            if self.hook:
+                self.hook(stats)
+
+    def point_key(self, point):
+        return self.key(point) if self.key else point
+
+    def cost(self, point):
+        return self.records[self.point_key(point)][0]
+
+    def steps(self, point):
+        """
+        Return [...(point, action)] from start to <point>, the action being the
+        one that led to the point (None for start)
+        """
+        steps = []
+        cur = self.point_key(point)
+        while cur is not None:
+            _, parent, action, p = self.records[cur]
+            steps.append((p, action))
+            cur = parent
+        steps.reverse()
+        return steps
+
+    def path(self, point):
+        return [p for p, _ in self.steps(point)]
+
+    def actions(self, point):
+        return [a for _, a in self.steps(point)[1:]]
+
+
+def edges(neighbours, distance):
+    """
+    Adapt neighbours(p) and distance(a, b) to Search successors
+    """
+    return lambda p: ((n, distance(p, n), None) for n in neighbours(p))
+
+
+def astar(
+    start,
+    is_goal,
+    neighbours,
+    distance,
+    heuristic=lambda p: 0,
+    ret=ASTAR_COST | ASTAR_PATHS,
+    **options,
+):
+    """
+    A-star pathfinding
+        start: point
+        is_goal(p) => bool
+        neighbour(p) => [...points]
+        distance(a, b) => number
+        heuristic(p) => number
+        ret: defines what astar should return
+        options: passed to Search (key, closed, hook...)
+
+    Returns path [...points] and cost
+    """
+
+    search = Search(start, is_goal, edges(neighbours, distance), heuristic, **options)
+    goal = search.run()
+
+    if goal is None:
+        return None
+
+    output = []
+    if ret & ASTAR_PATHS:
+        output.append(search.path(goal))
+    if ret & ASTAR_COST:
+        output.append(search.cost(goal))
+    if ret & ASTAR_GOAL:
+        output.append(goal)
+    return output
@@ -4,9 +4,13 @@
 import os.path
 import sys
 import struct
+from functools import wraps
 from itertools import takewhile
 import gzip
 
+from disasm import XrefIndex, disassemble, iter_words
+from heaptrace import HeapTrace
+from metrics import Metrics
 from solvers.qbasic import QBasicSolver
 from solvers.adventure import AdventureSolver
 
@@ -20,6 +24,9 @@ REG_MASK = 0x7
 VAL_MASK = 0x1FFFFFF
 NUM_MASK = 0xFFFFFFFF
 
+# Number of instructions between two calls to UM.tick()
+TICK = 1 << 16
+
 # Fetch operation from value
 O = lambda v: (v >> 28) & OP_MASK
 
@@ -53,6 +60,18 @@ def cmd(name, syn=None):
     return decorator
 
 
+def timed(phase):
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args):
+            with self.metrics.phase(phase):
+                return func(self, *args)
+
+        return wrapper
+
+    return decorator
+
+
 class UMException(Exception):
     pass
 
@@ -71,6 +90,8 @@ class UM:
         self.cmds = {}
         self.halted = True
         self.output_file = None
+        self.metrics = Metrics()
+        self.heap_trace = None
 
         for f in [getattr(self, k) for k in dir(self)]:
             if hasattr(f, "__func__"):
@@ -115,6 +136,32 @@ class UM:
 
         print(f"{ERASE}< loaded binary {filename}")
 
+    def copy_from(self, other):
+        """
+        Copy the whole state of machine <other>, which must be loaded, into this one.
+        Decoded array zero is reused, with operations bound to this machine instead.
+        """
+
+        self.finger = other.finger
+        self.regs = list(other.regs)
+        self.arrays = {k: list(v) for k, v in other.arrays.items()}
+        self.next_array = other.next_array
+        self.halted = other.halted
+        self.input = list(other.input)
+        self.last_output = other.last_output
+        self.debug = False
+        self.output_file = None
+        self.solver = None
+        self.solver_output = ""
+
+        rebind = {
+            other.ops[code][3]: func for code, (_, _, _, func) in self.ops.items()
+        }
+        self.decoded = [
+            (name, rebind[func], params, err) if func else (name, func, params, err)
+            for name, func, params, err in other.decoded
+        ]
+
     def decode(self, index=-1):
         """
         Pre-decode array zero for faster execution.
@@ -145,28 +192,66 @@ class UM:
         Run the UM until exception is raised.
         """
 
-        while not self.halted:
-            finger = self.finger
+        steps = 0
 
-            try:
-                name, func, params, err = self.decoded[finger]
-            except IndexError:
-                self.halted = True
-                raise UMRuntimeError(f"Invalid finger position {finger}")
+        try:
+            while not self.halted:
+                finger = self.finger
+
+                try:
+                    name, func, params, err = self.decoded[finger]
+                except IndexError:
+                    self.halted = True
+                    raise UMRuntimeError(f"Invalid finger position {finger}")
 
-            self.finger += 1
+                self.finger += 1
 
-            if err:
-                raise UMRuntimeError(err)
+                if err:
+                    raise UMRuntimeError(err)
 
-            try:
-                func(*params)
-            except Exception as e:
-                e.add_note(f"executing {name} {' '.join(map(str, params))} at {finger}")
-                raise
+                try:
+                    func(*params)
+                except Exception as e:
+                    e.add_note(
+                        f"executing {name} {' '.join(map(str, params))} at {finger}"
+                    )
+                    raise
+
+                steps += 1
+                if steps == TICK:
+                    steps = 0
+                    self.tick(TICK)
+        finally:
+            self.settle(steps)
 
         raise Halt()
 
+    def tick(self, steps):
+        """
+        Called every TICK instructions with the number of instructions executed
+        since the last call.
+        """
+        self.metrics.count("instructions", steps)
+
+        if self.metrics.due():
+            self.update_gauges()
+            self.metrics.log()
+
+    def settle(self, steps):
+        """
+        Called when run() exits with the number of instructions executed since the
+        last tick.
+        """
+        self.metrics.count("instructions", steps)
+
+        if steps and self.metrics.due():
+            self.update_gauges()
+            self.metrics.log()
+
+    def update_gauges(self):
+        self.metrics.gauge("heap_arrays", len(self.arrays))
+        self.metrics.gauge("heap_words", sum(len(a) for a in self.arrays.values()))
+
     @op(0, "cmov", "{0} = {1} if {2}", A, B, C)
     def op_cmove(self, a, b, c):
         if self.regs[c]:
@@ -210,14 +295,23 @@ class UM:
     def op_aloc(self, b, c):
         self.arrays[self.next_array] = [0] * self.regs[c]
         self.regs[b] = self.next_array
+
+        if self.heap_trace:
+            self.heap_trace.on_alloc(self.next_array, self.regs[c], self.finger - 1)
+
         self.next_array += 1
 
     @op(9, "aban", "del array({0})", C)
     def op_aban(self, c):
+        if self.heap_trace:
+            self.heap_trace.on_free(self.regs[c], len(self.arrays[self.regs[c]]))
+
         del self.arrays[self.regs[c]]
 
     @op(10, "out", "out {0}", C)
     def op_out(self, c):
+        self.metrics.count("output_bytes")
+
         if self.output_file:
             self.output_file.write(self.regs[c].to_bytes())
         else:
@@ -225,6 +319,8 @@ class UM:
 
             if self.solver:
                 self.solver_output += ch
+                if hasattr(self.solver, "feed"):
+                    self.solver.feed(ch)
 
             if ch == "\n":
                 self.last_output = ""
@@ -237,7 +333,9 @@ class UM:
         while not self.input:
             if self.solver:
                 output, self.solver_output = self.solver_output, ""
-                cmd = self.solver.handle_output(output)
+                self.metrics.count("solver_calls")
+                with self.metrics.phase("solver"):
+                    cmd = self.solver.handle_output(output)
 
                 if not cmd:
                     self.solver.print("done")
@@ -250,7 +348,8 @@ class UM:
                     self.add_input(cmd)
             else:
                 try:
-                    cmd = input()
+                    with self.metrics.phase("input"):
+                        cmd = self.read_line()
                 except EOFError:
                     self.regs[c] = NUM_MASK
                     return
@@ -258,12 +357,18 @@ class UM:
                 if self.handle_command(cmd):
                     return
 
+        self.metrics.count("input_bytes")
         self.regs[c], *self.input = self.input
 
     @op(12, "load", "load array({0}).{1}", B, C)
     def op_load(self, b, c):
         if self.regs[b] != 0:
             # Load
+            if self.heap_trace:
+                self.heap_trace.on_replace(
+                    len(self.arrays[0]), len(self.arrays[self.regs[b]])
+                )
+
             self.arrays[0] = list(self.arrays[self.regs[b]])
             self.decode()
             self.finger = self.regs[c]
@@ -275,33 +380,25 @@ class UM:
     def op_orth(self, s, v):
         self.regs[s] = v
 
-    def disassemble(self):
+    def disassemble(self, filename=None, out=sys.stdout):
         """
-        Disassemble array zero to stdout.
-        """
-
-        def group(s, count, sep=" "):
-            return sep.join(s[i : i + count] for i in range(0, len(s), count))
+        Disassemble binary <filename> to <out>, streaming it from disk, or array zero
+        when <filename> is omitted.
 
-        output = []
-        orthout_skip = 0
-
-        for i, v in enumerate(self.arrays[0]):
-            finger = f"{i:08x}"
-            data = group(f"{v:08x}", 2)
+        The cross-reference index for <filename> is cached in '<filename>.xref'.
+        """
 
-            try:
-                name, args, fmt, _ = self.ops[O(v)]
-                value = " ".join(map(str, [O(v)] + [a(v) for a in args]))
-                text = f"{name.upper():<4s} " + fmt.format(
-                    *[f"r{a(v)}" if a in [A, B, C, S] else a(v) for a in args]
-                )
-            except KeyError:
-                name = ""
-                value = str(v)
-                text = f".dat"
+        if filename:
+            index = XrefIndex.for_file(filename)
+            disassemble(iter_words(filename), index, out)
+        else:
+            disassemble(self.arrays[0], XrefIndex.for_words(self.arrays[0]), out)
 
-            print(f"{finger}: {data} | {value:13s} | {text:30s} {note}")
+    def read_line(self):
+        """
+        Read a line of user input, raise EOFError when there is none left
+        """
+        return input()
 
     def add_input(self, cmd):
         self.input += [ord(c) for c in cmd] + [10]
@@ -314,8 +411,9 @@ class UM:
                 name = "help"
                 args = []
             _, func = self.cmds[name]
-            if func(*args):
-                return
+            # Commands returning True replaced the machine state, and the input
+            # operation must not carry on reading
+            return func(*args)
         else:
             self.add_input(cmd)
 
@@ -360,7 +458,35 @@ class UM:
         for k, v in self.arrays.items():
             print(f"< {k:08x}: {len(v)} entries")
 
+    @cmd("heap", ".heap [on [sample] | off | dump <file>]")
+    def cmd_heap(self, action=None, arg=None):
+        """
+        trace allocations (following 1 array in <sample> for lifetimes), show or dump report as JSON
+        """
+        if action == "on":
+            try:
+                sample = int(arg or 16)
+            except ValueError:
+                sample = 0
+            if sample < 1:
+                print(f"< usage: {self.cmd_heap.syn}")
+                return
+            self.heap_trace = HeapTrace(self.arrays, sample=sample)
+            print(f"< tracing heap allocations, sampling 1 array in {arg or 16}")
+        elif action == "off":
+            self.heap_trace = None
+            print("< stopped tracing heap allocations")
+        elif not self.heap_trace:
+            print("< heap tracing is off, use '.heap on' to enable")
+        elif action == "dump":
+            self.heap_trace.dump(arg or "heap.json")
+            print(f"< dumped heap trace to {arg or 'heap.json'}")
+        else:
+            for l in self.heap_trace.report():
+                print(f"< {l}")
+
     @cmd("save", ".save [file]")
+    @timed("save")
     def cmd_save(self, name="state.ums"):
         """
         save the current state in <file> (defaults to 'state.ums')
@@ -422,9 +548,11 @@ class UM:
                     )
                 )
 
+        self.metrics.gauge("snapshot_bytes", os.path.getsize(name))
         print(f"{ERASE}< saved state to {name}")
 
     @cmd("load", ".load [file]")
+    @timed("load")
     def cmd_load(self, name="state.ums"):
         """
         load saved state from <file> (defaults to 'state.ums') and resume execution
@@ -473,6 +601,9 @@ class UM:
             else:
                 load_state(f)
 
+        if self.heap_trace:
+            self.heap_trace = HeapTrace(self.arrays, sample=self.heap_trace.sample)
+
         print(f"{ERASE}< decoding array 0...")
         self.decode()
         print(f"{ERASE}< loaded state from {name} (v{v})")
@@ -482,6 +613,30 @@ class UM:
 
         return True
 
+    @cmd("stats", ".stats [log <file> [seconds] | nolog]")
+    def cmd_stats(self, action=None, file="stats.jsonl", interval="10"):
+        """
+        show session metrics, or start/stop appending them periodically to <file> as JSON lines
+        """
+        self.update_gauges()
+
+        if action == "log":
+            try:
+                seconds = float(interval)
+            except ValueError:
+                seconds = 0
+            if seconds <= 0:
+                print(f"< usage: {self.cmd_stats.syn}")
+                return
+            self.metrics.start_log(file, seconds)
+            print(f"< logging metrics to {file} every {interval}s")
+        elif action == "nolog":
+            self.metrics.stop_log()
+            print("< stopped logging metrics")
+        else:
+            for l in self.metrics.report():
+                print(f"< {l}")
+
     @cmd("bin", ".bin [file]")
     def cmd_bin(self, file="dump.um"):
         """
@@ -528,6 +683,10 @@ def usage():
     print("  run <file>     executes the program in <file>")
     print("  asm <file>     disassembles the program in <file> on standard output")
     print("  load <file>    load state from <file> and resume execution")
+    print("  serve <file> [address] [quota]")
+    print("                 host sessions on a Unix socket path or localhost TCP port")
+    print("                 (default 7777), each running a copy of binary or state <file>")
+    print("                 for at most <quota> instructions")
     sys.exit(1)
 
 
@@ -539,11 +698,11 @@ if __name__ == "__main__":
 
     cmd = sys.argv[1]
 
-    if cmd in ("run", "asm", "load"):
+    if cmd in ("run", "asm", "load", "serve"):
         if len(sys.argv) < 3:
             usage()
 
-    if cmd in ("run", "asm"):
+    if cmd == "run":
         machine.load(sys.argv[2])
     elif cmd == "load":
         machine.cmd_load(sys.argv[2])
@@ -553,8 +712,18 @@ if __name__ == "__main__":
             machine.run()
         except Halt:
             print("Machine halted")
+        finally:
+            machine.metrics.stop_log()
     elif cmd == "asm":
-        machine.disassemble()
+        machine.disassemble(sys.argv[2])
+    elif cmd == "serve":
+        from server import serve
+
+        serve(
+            sys.argv[2],
+            *sys.argv[3:4],
+            quota=int(sys.argv[4]) if len(sys.argv) > 4 else None,
+        )
     else:
         print(f"Invalid command: {cmd}")
         usage()